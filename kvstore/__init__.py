@@ -1,8 +1,30 @@
 """KVStore - High-performance persistent Key/Value store."""
 __version__ = '1.0.0'
 
-from .core.store import KVStore, DataDirectoryLockError
-from .network.server import KVServer
-from .network.client import KVClient, KVClientError
+__all__ = ['KVStore', 'KVServer', 'KVClient', 'KVConnectionPool', 'DataDirectoryLockError', 'CorruptionError', 'KVClientError']
 
-__all__ = ['KVStore', 'KVServer', 'KVClient', 'DataDirectoryLockError', 'KVClientError']
+# Public names are resolved on first access so that light-weight entry points
+# (e.g. the client CLI) do not pay for importing the storage engine.
+_LAZY_IMPORTS = {
+    'KVStore': '.core.store',
+    'DataDirectoryLockError': '.core.store',
+    'CorruptionError': '.core.datafile',
+    'KVServer': '.network.server',
+    'KVClient': '.network.client',
+    'KVConnectionPool': '.network.client',
+    'KVClientError': '.network.client',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
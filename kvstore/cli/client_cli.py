@@ -1,9 +1,10 @@
 """Client CLI."""
-import argparse
 import sys
-from kvstore.network.client import KVClient, KVClientError
 from kvstore.utils.config import Config
 
+# Commands handled by the argparse-free fast path
+_FAST_COMMANDS = ('put', 'read', 'delete')
+
 
 def handle_put(client, key, value):
     """Handle PUT command."""
@@ -44,7 +45,7 @@ def handle_readrange(client, key, value):
         return 1
     results = client.read_key_range(key, value)
     if results:
-        for k, v in sorted(results.items()):
+        for k, v in results.items():  # Already in key order
             print(f"{k}: {v}")
     else:
         print("NOT_FOUND")
@@ -58,37 +59,118 @@ def handle_delete(client, key, value):
     return 0
 
 
-def main():
-    """Main entry point for client CLI."""
+def handle_batch(client, key, value):
+    """
+    Handle BATCH command: run one command per stdin line over a single connection.
+
+    Each line has the form `command key [value]`, e.g. `put user1 Alice`.
+    """
+    status = 0
+    for line in sys.stdin:
+        parts = line.split(None, 2)
+        if not parts:
+            continue
+        command = parts[0].lower()
+        handler = BATCH_HANDLERS.get(command)
+        if handler is None or len(parts) < 2:
+            print(f"Error: invalid batch line: {line.strip()}")
+            status = 1
+            continue
+        line_value = parts[2].rstrip('\r\n') if len(parts) == 3 else None
+        status |= handler(client, parts[1], line_value)
+    return status
+
+
+# Commands accepted on stdin by `batch`
+BATCH_HANDLERS = {
+    'put': handle_put,
+    'batchput': handle_batchput,
+    'read': handle_read,
+    'readrange': handle_readrange,
+    'delete': handle_delete,
+}
+
+# Every command accepted by the CLI; argparse choices and _FAST_COMMANDS are subsets
+_HANDLERS = dict(BATCH_HANDLERS, batch=handle_batch)
+
+
+def _parse_fast(argv):
+    """
+    Parse the common `[--host H] [--port P] command key [value]` form by hand.
+
+    Returns (host, port, command, key, value), or None when the arguments need
+    full argparse handling (help, unknown flags, other commands, bad values).
+    """
+    host, port = Config.CLIENT_HOST, Config.CLIENT_PORT
+    positional = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ('--host', '--port'):
+            if i + 1 >= len(argv):
+                return None
+            option, option_value = arg, argv[i + 1]
+            i += 2
+        elif arg.startswith(('--host=', '--port=')):
+            option, option_value = arg.split('=', 1)
+            i += 1
+        elif arg.startswith('-'):
+            return None
+        else:
+            positional.append(arg)
+            i += 1
+            continue
+
+        if option == '--host':
+            host = option_value
+        else:
+            try:
+                port = int(option_value)
+            except ValueError:
+                return None
+
+    if len(positional) not in (2, 3) or positional[0] not in _FAST_COMMANDS:
+        return None
+    command, key = positional[0], positional[1]
+    value = positional[2] if len(positional) == 3 else None
+    return host, port, command, key, value
+
+
+def _parse_args(argv):
+    """Parse arguments with argparse (full validation and --help)."""
+    import argparse
+
     parser = argparse.ArgumentParser(description='KVStore Client')
     parser.add_argument('--host', default=Config.CLIENT_HOST, help=f'Server host (default: {Config.CLIENT_HOST})')
     parser.add_argument('--port', type=int, default=Config.CLIENT_PORT, help=f'Server port (default: {Config.CLIENT_PORT})')
-    parser.add_argument('command', choices=['put', 'read', 'delete', 'batchput', 'readrange'],
-                        help='Command to execute')
-    parser.add_argument('key',
+    parser.add_argument('command', choices=['put', 'read', 'delete', 'batchput', 'readrange', 'batch'],
+                        help='Command to execute (batch reads "command key [value]" lines from stdin)')
+    parser.add_argument('key', nargs='?',
                         help='Key (or comma-separated keys for batchput, or start_key for readrange)')
     parser.add_argument('value', nargs='?',
                         help='Value (for PUT) or comma-separated values (for BATCHPUT) or end_key (for READRANGE)')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.key is None and args.command != 'batch':
+        parser.error('the following arguments are required: key')
+    return args.host, args.port, args.command, args.key, args.value
 
-    client = KVClient(args.host, args.port)
 
-    handlers = {
-        'put': handle_put,
-        'batchput': handle_batchput,
-        'read': handle_read,
-        'readrange': handle_readrange,
-        'delete': handle_delete,
-    }
+def main():
+    """Main entry point for client CLI."""
+    argv = sys.argv[1:]
+    parsed = _parse_fast(argv) or _parse_args(argv)
+    host, port, command, key, value = parsed
 
-    handler = handlers.get(args.command)
-    if handler:
+    # Imported after argument parsing so --help and usage errors stay cheap
+    from kvstore.network.client import KVClient, KVClientError
+
+    handler = _HANDLERS[command]
+    with KVClient(host, port) as client:
         try:
-            return handler(client, args.key, args.value)
+            return handler(client, key, value)
         except KVClientError as e:
             print(f"Error: {e}", file=sys.stderr)
             return 1
-    return 0
 
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 """Server CLI."""
 import argparse
+import logging
 import sys
 from kvstore.network.server import KVServer
 from kvstore.core.store import DataDirectoryLockError
@@ -43,6 +44,9 @@ def main():
                         help=f'Replication mode: async (default) or sync')
     args = parser.parse_args()
 
+    # Store and compaction status is reported through logging
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
     # Configure replication if replicas are specified
     if args.replicas and not args.replica:
         Config.REPLICATION_ENABLED = True
@@ -1,7 +1,7 @@
 """Core storage engine components."""
 from .store import KVStore
 from .wal import WAL
-from .datafile import DataFile
+from .datafile import DataFile, CorruptionError
 from .index import Index
 
-__all__ = ['KVStore', 'WAL', 'DataFile', 'Index']
+__all__ = ['KVStore', 'WAL', 'DataFile', 'CorruptionError', 'Index']
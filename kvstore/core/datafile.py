@@ -2,9 +2,50 @@
 import os
 import mmap
 import struct
-from typing import Tuple
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
 from ..utils.config import Config
 
+# Initial capacity of the append buffer; it grows on demand and is shrunk
+# back after flushing an unusually large group.
+_WRITE_BUFFER_SIZE = 64 * 1024
+
+# Batched reads spanning more than this ask the kernel to prefetch the span
+_PREFETCH_THRESHOLD = 64 * 1024
+
+# read() serves records past the current mapping with pread until the
+# unmapped tail exceeds this many bytes or has been read this many times
+_REMAP_THRESHOLD = 1024 * 1024
+_REMAP_AFTER_READS = 64
+_PREAD_SIZE = 4096  # First pread size; larger records need a second one
+
+# Largest piece copy_to() moves at once when copy_file_range is unavailable
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+# Data-only sync: appends still sync the new file size, but not timestamps
+_SYNC = getattr(os, 'fdatasync', os.fsync)
+
+# Precompiled length and checksum codecs shared by all record parsing
+_LENGTH = struct.Struct(Config.LENGTH_FORMAT)
+_CHECKSUM = struct.Struct(Config.CHECKSUM_FORMAT)
+
+
+# Bytes a record adds on top of its key and value: two lengths and the checksum
+_RECORD_OVERHEAD = 2 * _LENGTH.size + _CHECKSUM.size
+
+# File header: [magic(4)][format version(1)], followed by the records. Files
+# without it predate record checksums (see convert_legacy()); their first
+# bytes are a key length, which would have to exceed 1 GiB to match the magic.
+_MAGIC = b'KVDF'
+_FORMAT_VERSION = b'\x01'
+_FILE_HEADER = _MAGIC + _FORMAT_VERSION
+
+
+class CorruptionError(Exception):
+    """Raised when a stored record fails its checksum."""
+    pass
+
 
 class DataFile:
     """Append-only data file with memory mapping for efficient access."""
@@ -13,67 +54,352 @@ class DataFile:
         self.path = path
         self.file = open(path, 'a+b')
         self.file.seek(0, 2)  # Seek to end
-        self.size = self.file.tell()
-        self._mmap = None
+        self.size = self.file.tell()  # Bytes written to the file
+        self._synced_size = self.size  # Bytes known to be durable on disk
+        if self.size == 0:
+            self.file.write(_FILE_HEADER)
+            self.file.flush()
+            self.size = len(_FILE_HEADER)
+        else:
+            self._check_header()
+        self._sync_lock = threading.Lock()
+        self._buf = bytearray(_WRITE_BUFFER_SIZE)  # Records appended since the last flush_group()
+        self._buf_len = 0  # Bytes of self._buf in use
+        self._mv = None  # memoryview over the current mapping, used by read()
+        self._tail_reads = 0  # Reads past the mapping since it was last refreshed
         self._update_mmap()
 
+    def _check_header(self):
+        """Refuse a file whose header is missing or names an unknown format version."""
+        header = os.pread(self.file.fileno(), len(_FILE_HEADER), 0)
+        if header == _FILE_HEADER:
+            return
+        self.file.close()
+        if header[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{self.path} predates the data file header and record checksums; "
+                             f"convert it with DataFile.convert_legacy() (KVStore does this on open)")
+        raise ValueError(f"Unsupported data file format version in {self.path}")
+
+    @staticmethod
+    def write_header(fd: int) -> int:
+        """Write the file header at the start of fd. Returns its size, the offset of the first record."""
+        os.pwrite(fd, _FILE_HEADER, 0)
+        return len(_FILE_HEADER)
+
+    @staticmethod
+    def is_legacy(path: str) -> bool:
+        """Whether path holds records written before the file header and checksums."""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return False
+        with open(path, 'rb') as f:
+            return f.read(len(_MAGIC)) != _MAGIC
+
+    @classmethod
+    def convert_legacy(cls, src: str, dst: str) -> Dict[int, Tuple[int, int]]:
+        """
+        Copy the records of a legacy data file at src into a new, synced data
+        file at dst, adding the header and checksums.
+        Returns {old offset: (new offset, length)} for every complete record;
+        a torn record at the tail is dropped.
+        """
+        if os.path.exists(dst):
+            os.remove(dst)  # Left over from an interrupted conversion
+        new = cls(dst)
+        locations = {}
+        try:
+            with open(src, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Legacy format: [key_len(4)][key][value_len(4)][value]
+                unpack_from = _LENGTH.unpack_from
+                length_size = _LENGTH.size
+                size = len(mm)
+                pos = 0
+                while pos + length_size <= size:
+                    key_start = pos + length_size
+                    key_end = key_start + unpack_from(mm, pos)[0]
+                    value_start = key_end + length_size
+                    if value_start > size:
+                        break
+                    value_end = value_start + unpack_from(mm, key_end)[0]
+                    if value_end > size:
+                        break
+                    locations[pos] = new.append(mm[key_start:key_end], mm[value_start:value_end])
+                    pos = value_end
+                    if new._buf_len >= _COPY_CHUNK_SIZE:
+                        new.flush_group(sync=False)
+            new.flush_group()
+        finally:
+            new.close()
+        return locations
+
     def _update_mmap(self):
-        """Update memory map after file grows."""
-        if self._mmap:
-            self._mmap.close()
+        """Map the flushed part of the file.
+
+        The previous map is not closed here: readers may still hold views
+        into it, and it stays valid because the file only grows. It is unmapped
+        once the last reference goes away.
+
+        Readers load self._mv exactly once, so publishing it with a single
+        assignment keeps lock-free readers consistent.
+        """
         if self.size > 0:
-            self._mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mm, 'madvise'):
+                # Point reads dominate; generic readahead only wastes page cache
+                mm.madvise(mmap.MADV_RANDOM)
+            self._mv = memoryview(mm)
+            self._tail_reads = 0
 
     def append(self, key: bytes, value: bytes) -> Tuple[int, int]:
         """
-        Append key-value pair to data file.
-        Returns (offset, length) for indexing.
+        Append key-value pair to the in-memory write buffer.
+        Returns (offset, length) for indexing; the record becomes durable
+        and readable after the next flush_group().
         """
-        # Format: [key_len(4)][key][value_len(4)][value]
-        key_len = struct.pack(Config.LENGTH_FORMAT, len(key))
-        value_len = struct.pack(Config.LENGTH_FORMAT, len(value))
+        # Format: [key_len(4)][key][value_len(4)][value][crc32(4)]
+        key_len = len(key)
+        value_len = len(value)
+        length = _RECORD_OVERHEAD + key_len + value_len
 
-        offset = self.size
-        data = key_len + key + value_len + value
+        pos = self._buf_len
+        end = pos + length
+        buf = self._buf
+        if end > len(buf):
+            # Grow geometrically so a batch needs O(log N) reallocations
+            buf.extend(bytes(max(end, 2 * len(buf)) - len(buf)))
 
-        self.file.write(data)
-        self.file.flush()
-        os.fsync(self.file.fileno())
+        # Pack directly into the shared buffer: no per-record allocations
+        _LENGTH.pack_into(buf, pos, key_len)
+        pos += _LENGTH.size
+        buf[pos:pos + key_len] = key
+        pos += key_len
+        _LENGTH.pack_into(buf, pos, value_len)
+        pos += _LENGTH.size
+        buf[pos:pos + value_len] = value
+        pos += value_len
 
-        self.size += len(data)
-        self._update_mmap()
+        # Checksum covers the whole record up to the trailer
+        with memoryview(buf) as view, view[self._buf_len:pos] as record:
+            crc = zlib.crc32(record)
+        _CHECKSUM.pack_into(buf, pos, crc)
+
+        offset = self.size + self._buf_len
+        self._buf_len = end
+        return offset, length
+
+    def append_batch(self, pairs: Iterable[Tuple[bytes, bytes]], sync: bool = True) -> List[Tuple[int, int]]:
+        """
+        Append several key-value pairs and flush them with a single write and fsync.
+        Returns (offset, length) for each pair, in order.
+        """
+        pairs = list(pairs)
+        # Reserve room for the whole batch up front instead of growing per record
+        needed = self._buf_len + sum(len(key) + len(value) for key, value in pairs) + len(pairs) * _RECORD_OVERHEAD
+        if needed > len(self._buf):
+            self._buf.extend(bytes(needed - len(self._buf)))
 
-        return offset, len(data)
+        append = self.append
+        locations = [append(key, value) for key, value in pairs]
+        self.flush_group(sync)
+        return locations
 
-    def read(self, offset: int) -> Tuple[bytes, bytes]:
-        """Read key-value pair at given offset."""
-        if not self._mmap:
+    def flush_group(self, sync: bool = True):
+        """
+        Write all buffered records with a single write and fsync.
+        With sync=False the records are only handed to the OS (and become
+        readable); the caller must call sync() before relying on durability.
+        """
+        if self._buf_len:
+            with memoryview(self._buf) as view:
+                self.file.write(view[:self._buf_len])
+            self.file.flush()
+
+            self.size += self._buf_len
+            self._buf_len = 0
+            if len(self._buf) > 16 * _WRITE_BUFFER_SIZE:
+                self._buf = bytearray(_WRITE_BUFFER_SIZE)
+            # The mapping is refreshed lazily by the next read past its end
+
+        if sync:
+            self.sync()
+
+    def sync(self, upto: int = None):
+        """
+        Make flushed records durable, at least up to byte offset upto (default: all).
+        Safe to call without the store's write lock; concurrent callers share
+        one fsync when it already covers their records.
+        """
+        with self._sync_lock:
+            target = self.size
+            if (upto if upto is not None else target) <= self._synced_size or self.file.closed:
+                return  # Already durable (a closed file was synced on close)
+            _SYNC(self.file.fileno())
+            self._synced_size = target
+
+    def read(self, offset: int) -> Tuple[memoryview, memoryview]:
+        """
+        Read key-value pair at given offset.
+        Returns zero-copy memoryviews into the mapped file; callers that keep
+        the data beyond the current lock hold must convert them to bytes.
+        Safe to call without the store's lock for records already flushed.
+        """
+        mv = self._mv
+        if (mv is None or offset >= len(mv)) and offset < self.size:
+            # File grew past the current mapping. While the unmapped tail is
+            # small, a pread is cheaper than a new mapping (and its page faults);
+            # remap once the tail grows or keeps being read.
+            mapped = len(mv) if mv is not None else 0
+            self._tail_reads += 1
+            if self.size - mapped <= _REMAP_THRESHOLD and self._tail_reads <= _REMAP_AFTER_READS:
+                return self._pread(offset)
+            self._update_mmap()
+            mv = self._mv
+        if mv is None:
             raise ValueError("Memory map not available (file may be empty or not initialized)")
+        return self._parse(mv, offset)
 
-        # Read key length
-        key_len = struct.unpack(Config.LENGTH_FORMAT, self._mmap[offset:offset+Config.LENGTH_SIZE])[0]
-        offset += Config.LENGTH_SIZE
+    def _pread(self, offset: int) -> Tuple[memoryview, memoryview]:
+        """Read the record at offset with pread instead of through the mapping."""
+        fd = self.file.fileno()
+        data = os.pread(fd, min(self.size - offset, _PREAD_SIZE), offset)
+        if len(data) >= _LENGTH.size:
+            key_len = _LENGTH.unpack_from(data, 0)[0]
+            if len(data) >= _LENGTH.size + key_len + _LENGTH.size:
+                value_len = _LENGTH.unpack_from(data, _LENGTH.size + key_len)[0]
+                length = _RECORD_OVERHEAD + key_len + value_len
+                if length > len(data):
+                    data = os.pread(fd, length, offset)
+            else:
+                data = os.pread(fd, self.size - offset, offset)
+        return self._parse(memoryview(data), 0, offset)
 
-        # Read key
-        key = bytes(self._mmap[offset:offset+key_len])
+    @staticmethod
+    def _parse(mv: memoryview, offset: int, file_offset: int = None) -> Tuple[memoryview, memoryview]:
+        """Parse and verify the record starting at offset in mv."""
+        # Read key length and key
+        start = offset
+        key_len = _LENGTH.unpack_from(mv, offset)[0]
+        offset += _LENGTH.size
+        key = mv[offset:offset+key_len]
         offset += key_len
 
-        # Read value length
-        value_len = struct.unpack(Config.LENGTH_FORMAT, self._mmap[offset:offset+Config.LENGTH_SIZE])[0]
-        offset += Config.LENGTH_SIZE
+        # Read value length and value
+        value_len = _LENGTH.unpack_from(mv, offset)[0]
+        offset += _LENGTH.size
+        value = mv[offset:offset+value_len]
+        offset += value_len
 
-        # Read value
-        value = bytes(self._mmap[offset:offset+value_len])
+        # Verify the record checksum
+        with mv[start:offset] as record:
+            crc = zlib.crc32(record)
+        if crc != _CHECKSUM.unpack_from(mv, offset)[0]:
+            raise CorruptionError(f"Checksum mismatch for record at offset {start if file_offset is None else file_offset}")
 
         return key, value
 
+    def locate(self, offset: int, key: bytes, value: bytes) -> Optional[Tuple[int, int]]:
+        """
+        Returns (offset, length) if an intact record of key and value is stored
+        at offset, else None (past the end of the file, torn or different).
+        """
+        length = _RECORD_OVERHEAD + len(key) + len(value)
+        if offset + length > self.size:
+            return None
+        try:
+            stored_key, stored_value = self.read(offset)
+        except (CorruptionError, ValueError, struct.error):
+            return None
+        if stored_key != key or stored_value != value:
+            return None
+        return offset, length
+
+    def copy_to(self, fd: int, offset: int, length: int, dst_offset: int):
+        """
+        Copy length flushed bytes starting at offset into file descriptor fd
+        at dst_offset. Uses copy_file_range where available, so the bytes
+        never pass through user space; falls back to pread/pwrite.
+        """
+        src = self.file.fileno()
+        end = offset + length
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while offset < end:
+                    copied = os.copy_file_range(src, fd, end - offset, offset, dst_offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+                    dst_offset += copied
+            except OSError:
+                pass  # Unsupported here (e.g. across filesystems); copy the rest by hand
+        while offset < end:
+            data = os.pread(src, min(end - offset, _COPY_CHUNK_SIZE), offset)
+            if not data:
+                raise ValueError(f"Data file ends before offset {end}")
+            os.pwrite(fd, data, dst_offset)
+            offset += len(data)
+            dst_offset += len(data)
+
+    def read_many(self, offsets: Iterable[int]) -> List[Tuple[memoryview, memoryview]]:
+        """
+        Read the key-value pairs at several offsets in one call.
+        Same result as calling read() for each offset, with the per-record
+        attribute lookups hoisted out of the parse loop.
+        """
+        offsets = list(offsets)
+        mv = self._mv
+        if offsets and (mv is None or max(offsets) >= len(mv)) and max(offsets) < self.size:
+            # File grew past the current mapping
+            self._update_mmap()
+            mv = self._mv
+        if mv is None:
+            if offsets:
+                raise ValueError("Memory map not available (file may be empty or not initialized)")
+            return []
+
+        if len(offsets) > 1:
+            self._prefetch(mv, min(offsets), max(offsets))
+
+        unpack_from = _LENGTH.unpack_from
+        length_size = _LENGTH.size
+        unpack_checksum = _CHECKSUM.unpack_from
+        crc32 = zlib.crc32
+        records = []
+        append = records.append
+        for offset in offsets:
+            key_start = offset + length_size
+            key_end = key_start + unpack_from(mv, offset)[0]
+            value_start = key_end + length_size
+            value_end = value_start + unpack_from(mv, key_end)[0]
+            with mv[offset:value_end] as record:
+                crc = crc32(record)
+            if crc != unpack_checksum(mv, value_end)[0]:
+                raise CorruptionError(f"Checksum mismatch for record at offset {offset}")
+            append((mv[key_start:key_end], mv[value_start:value_end]))
+        return records
+
+    @staticmethod
+    def _prefetch(mv: memoryview, start: int, end: int):
+        """Ask the kernel to read ahead the mapped span [start, end] if it is large."""
+        if end - start <= _PREFETCH_THRESHOLD or not hasattr(mv.obj, 'madvise'):
+            return
+        start -= start % mmap.PAGESIZE  # madvise needs a page-aligned start
+        end = min(end + _PREFETCH_THRESHOLD, len(mv))  # Cover the last record too
+        try:
+            mv.obj.madvise(mmap.MADV_WILLNEED, start, end - start)
+        except (OSError, ValueError):
+            pass  # Only a hint
+
     def close(self):
-        """Close data file and mmap."""
+        """
+        Flush pending records and close the data file.
+        The mapping is not torn down: lock-free readers may still be reading
+        through it, and it is unmapped once they drop their references.
+        """
         try:
-            if self._mmap:
-                self._mmap.close()
+            self.flush_group()
+            # Map everything written so late readers never need the file handle
+            self._update_mmap()
         except (ValueError, OSError):
-            # mmap already closed or invalid
+            # file already closed
             pass
 
         try:
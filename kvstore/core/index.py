@@ -1,44 +1,299 @@
 """In-memory hash index mapping keys to file offsets."""
 import os
+import mmap
 import pickle
-from typing import Optional, Dict, Tuple
+import struct
+from bisect import bisect_left, bisect_right, insort
+from typing import Optional, Dict, Iterable, List, Tuple
+
+# Delta record header: [op(1)][key_len(4)][offset(8)][length(4)] followed by the key
+_DELTA_HEADER = struct.Struct('!BIQI')
+_DELTA_PUT = 0
+_DELTA_DELETE = 1
+
+# Delta journal header: [magic(4)][generation(8)]. Each base snapshot is
+# pickled after its generation, and a journal only applies to the base of the
+# same generation: one left over from before a snapshot (e.g. by a crash right
+# after the snapshot replaced the old base) is ignored, since the snapshot
+# already holds its changes. Journals and bases from before generations
+# carry neither and only apply to each other.
+_DELTA_MAGIC = b'KVDJ'
+_DELTA_FILE_HEADER = struct.Struct('!4sQ')
+
+# Locations are kept as one int, offset << _LENGTH_BITS | length, instead of
+# an (offset, length) tuple: roughly 80 bytes less per key
+_LENGTH_BITS = 40
+_LENGTH_MASK = (1 << _LENGTH_BITS) - 1
+
+
+def pack_location(offset: int, length: int) -> int:
+    """Packs a record's (offset, length) into the int stored in Index.index."""
+    return offset << _LENGTH_BITS | length
+
+
+def unpack_location(location: int) -> Tuple[int, int]:
+    """Returns the (offset, length) packed into an Index.index value."""
+    return location >> _LENGTH_BITS, location & _LENGTH_MASK
+
+
+# Keys per bucket of _SortedKeys; a bucket is split once it holds twice this
+_BUCKET_SIZE = 1000
+
+
+class _SortedKeys:
+    """
+    Sorted list of keys split into buckets of at most 2 * _BUCKET_SIZE keys.
+
+    An insert or delete shifts only the keys of one bucket instead of the
+    whole list, so changes stay cheap at millions of keys; lookups bisect the
+    bucket maxima and then one bucket, and a range costs O(log N + k).
+    """
+
+    __slots__ = ('_buckets', '_maxes')
+
+    def __init__(self, keys: Iterable[bytes] = ()):
+        keys = sorted(keys)
+        self._buckets = [keys[i:i + _BUCKET_SIZE] for i in range(0, len(keys), _BUCKET_SIZE)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]  # Last key of each bucket
+
+    def add(self, key: bytes):
+        """Insert key, which must not be present."""
+        buckets = self._buckets
+        maxes = self._maxes
+        if not buckets:
+            buckets.append([key])
+            maxes.append(key)
+            return
+        i = bisect_left(maxes, key)
+        if i == len(maxes):
+            # Past the current last key: extend the last bucket
+            i -= 1
+            bucket = buckets[i]
+            bucket.append(key)
+            maxes[i] = key
+        else:
+            bucket = buckets[i]
+            insort(bucket, key)
+        if len(bucket) > 2 * _BUCKET_SIZE:
+            buckets.insert(i + 1, bucket[_BUCKET_SIZE:])
+            del bucket[_BUCKET_SIZE:]
+            maxes.insert(i, bucket[-1])
+
+    def remove(self, key: bytes):
+        """Remove key, which must be present."""
+        i = bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+
+    def irange(self, start_key: bytes, end_key: bytes) -> List[bytes]:
+        """Keys in [start_key, end_key], in order."""
+        buckets = self._buckets
+        i = bisect_left(self._maxes, start_key)
+        if i == len(buckets):
+            return []
+        bucket = buckets[i]
+        lo = bisect_left(bucket, start_key)
+        keys = []
+        while True:
+            hi = bisect_right(bucket, end_key, lo)
+            keys.extend(bucket[lo:hi])
+            i += 1
+            if hi < len(bucket) or i == len(buckets):
+                return keys
+            bucket = buckets[i]
+            lo = 0
 
 
 class Index:
-    """In-memory hash index mapping keys to file offsets."""
+    """
+    In-memory hash index mapping keys to file offsets.
+
+    Persisted as a pickled base snapshot plus an append-only delta journal
+    of changes made since that snapshot. A new snapshot is only written once
+    the journal grows past half the size of the base.
+
+    Keys are also kept in a bucketed sorted list (_SortedKeys), so range
+    lookups cost O(log N + k) instead of a scan over the whole index, and
+    adding or removing a key does not shift every key after it.
+
+    The index dict maps keys to packed locations (see pack_location); the
+    methods take and return (offset, length) tuples. live_bytes tracks the
+    total length of the indexed records, so the live share of the data file
+    is known without a scan.
+    """
 
     def __init__(self, path: str):
         self.path = path
-        self.index: Dict[bytes, Tuple[int, int]] = {}
-        self.load()
+        self.delta_path = path + '.delta'
+        self.index: Dict[bytes, int] = {}
+        self._keys = _SortedKeys()  # Keys of self.index, in order
+        self.live_bytes = 0  # Sum of the lengths of all indexed records
+        self._base_size = 0
+        self._generation = 0  # Generation of the base snapshot
+        self._delta_start = 0  # Size of the journal's header
+        if self.load():
+            self._delta_f = open(self.delta_path, 'ab')
+        else:
+            self._start_delta()
 
     def put(self, key: bytes, offset: int, length: int):
         """Add or update key in index."""
-        self.index[key] = (offset, length)
+        # (bytes objects cache their own hash, so it is computed once per key.)
+        index = self.index
+        old = index.get(key)
+        index[key] = offset << _LENGTH_BITS | length
+        if old is None:
+            self._keys.add(key)
+            self.live_bytes += length
+        else:
+            self.live_bytes += length - (old & _LENGTH_MASK)
+
+    def put_journaled(self, key: bytes, offset: int, length: int):
+        """Add or update key in index and record the change in the delta journal."""
+        self.put(key, offset, length)
+        self._delta_f.write(_DELTA_HEADER.pack(_DELTA_PUT, len(key), offset, length) + key)
 
     def get(self, key: bytes) -> Optional[Tuple[int, int]]:
         """Get offset and length for key."""
-        return self.index.get(key)
+        location = self.index.get(key)
+        return None if location is None else unpack_location(location)
 
     def get_range(self, start_key: bytes, end_key: bytes) -> Dict[bytes, Tuple[int, int]]:
-        """Get all keys in range [start_key, end_key]."""
-        result = {}
-        for key, location in self.index.items():
-            if start_key <= key <= end_key:
-                result[key] = location
-        return result
-
-    def delete(self, key: bytes):
-        """Remove key from index."""
-        self.index.pop(key, None)
-
-    def save(self):
-        """Persist index to disk."""
-        with open(self.path, 'wb') as f:
+        """Get all keys in range [start_key, end_key], in key order."""
+        if start_key > end_key:
+            return {}
+        index = self.index
+        return {key: (index[key] >> _LENGTH_BITS, index[key] & _LENGTH_MASK)
+                for key in self._keys.irange(start_key, end_key)}
+
+    def delete(self, key: bytes) -> Optional[Tuple[int, int]]:
+        """Remove key from index. Returns its (offset, length), or None if absent."""
+        location = self.index.pop(key, None)
+        if location is None:
+            return None
+        self._keys.remove(key)
+        self.live_bytes -= location & _LENGTH_MASK
+        return unpack_location(location)
+
+    def delete_journaled(self, key: bytes) -> Optional[Tuple[int, int]]:
+        """Remove key from index and record the change in the delta journal."""
+        location = self.delete(key)
+        if location is not None:
+            self._delta_f.write(_DELTA_HEADER.pack(_DELTA_DELETE, len(key), 0, 0) + key)
+        return location
+
+    def replace(self, index: Dict[bytes, Tuple[int, int]]):
+        """Swap in a complete new key -> (offset, length) mapping."""
+        self.index = {key: offset << _LENGTH_BITS | length for key, (offset, length) in index.items()}
+        self._keys = _SortedKeys(self.index)
+        self.live_bytes = sum(length for _, length in index.values())
+
+    def needs_snapshot(self) -> bool:
+        """Whether the delta journal has grown enough to warrant a new base snapshot."""
+        return self._delta_f.tell() - self._delta_start > self._base_size // 2
+
+    def flush(self):
+        """Make the delta journal durable."""
+        self._delta_f.flush()
+        os.fsync(self._delta_f.fileno())
+
+    def save(self, force: bool = False):
+        """
+        Persist index to disk.
+
+        Only flushes the delta journal unless it has outgrown the base snapshot
+        (or force is set), in which case a new snapshot replaces base and journal.
+        Callers must prevent concurrent modification while a snapshot is taken.
+        """
+        if not force and not self.needs_snapshot():
+            self.flush()
+            return
+
+        # The new base gets a new generation, which retires the current
+        # journal even if a crash stops us before it is truncated
+        generation = self._generation + 1
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(generation, f)
             pickle.dump(self.index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._base_size = os.path.getsize(self.path)
+        self._generation = generation
+
+        self._delta_f.close()
+        self._start_delta()
+
+    def _start_delta(self):
+        """Replace the delta journal with an empty one for the current base."""
+        self._delta_f = open(self.delta_path, 'wb')
+        self._delta_f.write(_DELTA_FILE_HEADER.pack(_DELTA_MAGIC, self._generation))
+        self._delta_start = _DELTA_FILE_HEADER.size
 
-    def load(self):
-        """Load index from disk."""
+    def load(self) -> bool:
+        """
+        Load index from disk: base snapshot followed by the delta journal.
+        Returns whether the journal on disk belongs to the loaded base, so
+        new changes can be appended to it.
+        """
+        stamped = False  # Base carries a generation
         if os.path.exists(self.path):
             with open(self.path, 'rb') as f:
                 self.index = pickle.load(f)
+                if isinstance(self.index, int):
+                    self._generation = self.index
+                    self.index = pickle.load(f)
+                    stamped = True
+            if self.index and isinstance(next(iter(self.index.values())), tuple):
+                # Snapshot written before locations were packed
+                self.index = {key: pack_location(*location) for key, location in self.index.items()}
+            self._base_size = os.path.getsize(self.path)
+
+        current = False
+        if os.path.exists(self.delta_path) and os.path.getsize(self.delta_path) > 0:
+            with open(self.delta_path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if mm[:len(_DELTA_MAGIC)] != _DELTA_MAGIC:
+                        current = not stamped  # Journal from before generations
+                        if current:
+                            self._apply_delta(mm, 0)
+                    elif len(mm) >= _DELTA_FILE_HEADER.size:
+                        current = _DELTA_FILE_HEADER.unpack_from(mm)[1] == self._generation
+                        if current:
+                            self._apply_delta(mm, _DELTA_FILE_HEADER.size)
+                            self._delta_start = _DELTA_FILE_HEADER.size
+
+        self._keys = _SortedKeys(self.index)
+        self.live_bytes = sum(location & _LENGTH_MASK for location in self.index.values())
+        return current
+
+    def _apply_delta(self, buf, pos: int):
+        """Fold the delta journal records in buf, starting at pos, into the in-memory index."""
+        index = self.index
+        unpack_from = _DELTA_HEADER.unpack_from
+        header_size = _DELTA_HEADER.size
+        end = len(buf)
+        while pos + header_size <= end:
+            op, key_len, offset, length = unpack_from(buf, pos)
+            pos += header_size
+            if pos + key_len > end:
+                break  # Torn record at the tail
+            key = buf[pos:pos + key_len]
+            pos += key_len
+            if op == _DELTA_PUT:
+                index[key] = offset << _LENGTH_BITS | length
+            else:
+                index.pop(key, None)
+
+    def close(self):
+        """Close the delta journal."""
+        try:
+            self._delta_f.close()
+        except (ValueError, OSError):
+            pass
@@ -1,22 +1,45 @@
 """Main KVStore implementation."""
+import logging
 import threading
 import os
 import sys
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, Tuple, Union
 
 from .wal import WAL
 from .datafile import DataFile
-from .index import Index
-from ..utils.rwlock import RWLock, ReadLock, WriteLock
+from .index import Index, unpack_location
+from ..utils.rwlock import MutexLock, RWLock, ShardedRWLock
 from ..utils.config import Config
 
+logger = logging.getLogger(__name__)
+
 
 class DataDirectoryLockError(Exception):
     """Raised when data directory is already locked by another process."""
     pass
 
 
+if sys.platform == 'win32':
+    import msvcrt
+
+    def _lock_file(fd: int):
+        """Take a non-blocking exclusive lock on fd; raises OSError if held elsewhere."""
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(fd: int):
+        """Take a non-blocking exclusive lock on fd; raises OSError if held elsewhere."""
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+# Lock file path -> [descriptor, stores using it] for directories this process holds
+_dir_locks = {}
+_dir_locks_mutex = threading.Lock()
+
+
 class KVStore:
     """Core Key/Value store implementation."""
 
@@ -31,18 +54,34 @@ class KVStore:
 
         # Initialize components
         self.wal = WAL(str(self.data_dir / Config.WAL_FILENAME))
+        self._upgrade_data_file()
         self.data_file = DataFile(str(self.data_dir / Config.DATA_FILENAME))
         self.index = Index(str(self.data_dir / Config.INDEX_FILENAME))
 
-        # Reader-Writer Lock for thread safety (allows concurrent reads)
-        self.rwlock = RWLock()
+        # Reader-Writer Lock for thread safety (allows concurrent reads). Point
+        # reads never take it, so a write-heavy workload may prefer a mutex
+        if Config.STORE_LOCK == 'mutex':
+            self.rwlock = MutexLock()
+        elif Config.RWLOCK_SHARDS > 1:
+            self.rwlock = ShardedRWLock(Config.RWLOCK_SHARDS)
+        else:
+            self.rwlock = RWLock()
+
+        # Serializes data-file appends on their own, so writers placing a
+        # record do not wait for readers. Taken after rwlock when both are held.
+        self._append_lock = threading.Lock()
 
-        # Separate lock for WAL writes (prevents WAL blocking in read-heavy workloads)
-        self.wal_lock = threading.Lock()
+        # Data file replaced by the last compaction; kept open until the next
+        # one, since lock-free readers may still be reading through it
+        self._retired_data_file = None
 
         # Recover from crash if needed
         self._recover()
 
+        # (index mapping, data file) pair used by lock-free point reads.
+        # Only replaced as a whole, so readers always see a matching pair.
+        self._read_view = (self.index.index, self.data_file)
+
         # Initialize replication (only if not a replica and replication is enabled)
         self.replicator = None
         if not is_replica and Config.REPLICATION_ENABLED:
@@ -89,98 +128,145 @@ class KVStore:
             self.replica_manager.start_health_monitoring()
 
             replica_count = len(Config.REPLICA_ADDRESSES)
-            print(f"[KVStore] Replication enabled in {Config.REPLICATION_MODE} mode with {replica_count} replicas")
-        except Exception as e:
-            print(f"[KVStore] Failed to initialize replication: {e}")
+            logger.info("[KVStore] Replication enabled in %s mode with %d replicas", Config.REPLICATION_MODE, replica_count)
+        except Exception:
+            logger.exception("[KVStore] Failed to initialize replication")
             self.replicator = None
 
     def _acquire_lock(self):
-        """Acquire an exclusive lock on the data directory."""
-        try:
-            # Try to create lockfile with exclusive creation
-            # If file exists, open will fail (on most systems)
-            if self.lockfile_path.exists():
-                # Check if it's a stale lock (process died)
+        """
+        Acquire an exclusive lock on the data directory.
+
+        Uses an OS advisory lock on the lock file (flock, or msvcrt.locking
+        on Windows), which the kernel drops when the owning process dies, so
+        there are no stale locks to detect. Stores in the same process share
+        the lock (sequential reuse of a directory in one process is OK).
+        """
+        key = str(self.lockfile_path.resolve())
+        with _dir_locks_mutex:
+            held = _dir_locks.get(key)
+            if held is not None:
+                held[1] += 1
+                return
+            try:
+                fd = os.open(key, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError as e:
+                logger.warning("[KVStore] Could not acquire directory lock: %s", e)
+                return
+            try:
+                _lock_file(fd)
+            except OSError:
                 try:
-                    with open(self.lockfile_path, 'r') as f:
-                        pid = int(f.read().strip())
-
-                    # Check if it's our own process (sequential usage in same process is OK)
-                    current_pid = os.getpid()
-                    if pid == current_pid:
-                        # Same process - this is OK, just reuse the lock
-                        # (happens when one store is closed and another opens in same process)
-                        return
-
-                    # Check if process is still running
-                    if self._is_process_running(pid):
-                        error_msg = (
-                            f"\n{'='*70}\n"
-                            f"ERROR: Data directory is already in use!\n"
-                            f"{'='*70}\n"
-                            f"Directory: {self.data_dir}\n"
-                            f"Used by process: {pid}\n"
-                            f"\n"
-                            f"Each KVStore instance must use a unique data directory.\n"
-                            f"{'='*70}\n"
-                        )
-                        raise DataDirectoryLockError(error_msg)
-                    else:
-                        # Stale lock, remove it
-                        print(f"[KVStore] Removing stale lock file (PID {pid} not running)")
-                        self.lockfile_path.unlink()
-                except (ValueError, IOError):
-                    # Invalid lock file, remove it
-                    self.lockfile_path.unlink()
-
-            # Write our PID to the lock file
-            with open(self.lockfile_path, 'w') as f:
-                f.write(str(os.getpid()))
-
-        except DataDirectoryLockError:
-            raise
-        except Exception as e:
-            print(f"[KVStore] Warning: Could not acquire directory lock: {e}")
-
-    def _is_process_running(self, pid: int) -> bool:
-        """Check if a process with given PID is running."""
-        try:
-            if sys.platform == 'win32':
-                # Windows
-                import ctypes
-                kernel32 = ctypes.windll.kernel32
-                PROCESS_QUERY_INFORMATION = 0x0400
-                handle = kernel32.OpenProcess(PROCESS_QUERY_INFORMATION, 0, pid)
-                if handle:
-                    kernel32.CloseHandle(handle)
-                    return True
-                return False
-            else:
-                # Unix/Linux/Mac
-                os.kill(pid, 0)  # Signal 0 doesn't kill, just checks existence
-                return True
-        except (OSError, AttributeError):
-            return False
+                    pid = os.read(fd, 32).decode().strip() or 'unknown'
+                except (OSError, UnicodeDecodeError):
+                    pid = 'unknown'
+                os.close(fd)
+                error_msg = (
+                    f"\n{'='*70}\n"
+                    f"ERROR: Data directory is already in use!\n"
+                    f"{'='*70}\n"
+                    f"Directory: {self.data_dir}\n"
+                    f"Used by process: {pid}\n"
+                    f"\n"
+                    f"Each KVStore instance must use a unique data directory.\n"
+                    f"{'='*70}\n"
+                )
+                raise DataDirectoryLockError(error_msg)
+
+            # Record our PID for the error message other processes show
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode())
+            _dir_locks[key] = [fd, 1]
 
     def _release_lock(self):
-        """Release the directory lock."""
-        try:
-            if self.lockfile_path.exists():
-                self.lockfile_path.unlink()
-        except Exception as e:
-            print(f"[KVStore] Warning: Could not release lock: {e}")
+        """Release the directory lock once the last store in this process using it closes."""
+        key = str(self.lockfile_path.resolve())
+        with _dir_locks_mutex:
+            held = _dir_locks.get(key)
+            if held is None:
+                return
+            held[1] -= 1
+            if held[1] == 0:
+                del _dir_locks[key]
+                try:
+                    os.close(held[0])  # Closing the descriptor drops the lock
+                except OSError as e:
+                    logger.warning("[KVStore] Could not release lock: %s", e)
+
+    def _upgrade_data_file(self):
+        """
+        Convert a data file written before record checksums to the current
+        format, remapping the index to the records' new offsets.
+
+        The converted data file and index are written next to the originals and
+        then swapped in: the data file first, which commits the upgrade, then
+        the index. A crash between the two swaps is finished on the next open.
+        """
+        data_path = str(self.data_dir / Config.DATA_FILENAME)
+        index_path = str(self.data_dir / Config.INDEX_FILENAME)
+        upgrade_path = data_path + '.upgrade'
+        upgrade_index_path = index_path + '.upgrade'
+
+        if DataFile.is_legacy(data_path):
+            logger.info("[KVStore] Upgrading %s to the checksummed data file format", data_path)
+            index = Index(index_path)
+            try:
+                locations = DataFile.convert_legacy(data_path, upgrade_path)
+                remapped = {}
+                for key, location in index.index.items():
+                    new_location = locations.get(unpack_location(location)[0])
+                    if new_location is None:
+                        logger.warning("[KVStore] Dropping key %r: its record is missing from %s", key, data_path)
+                    else:
+                        remapped[key] = new_location
+            finally:
+                index.close()
+            new_index = Index(upgrade_index_path)
+            new_index.replace(remapped)
+            new_index.save(force=True)
+            new_index.close()
+            os.replace(upgrade_path, data_path)
+        elif not os.path.exists(upgrade_index_path):
+            return
+
+        # The data file is upgraded; its index replaces the old one and journal
+        for path in (index_path + '.delta', upgrade_index_path + '.delta'):
+            if os.path.exists(path):
+                os.remove(path)
+        os.replace(upgrade_index_path, index_path)
 
     def _recover(self):
-        """Recover from crash by replaying WAL."""
-        entries = self.wal.replay()
-        for entry in entries:
-            if entry['op'] == 'put':
-                offset, length = self.data_file.append(entry['key'], entry['value'])
-                self.index.put(entry['key'], offset, length)
-            elif entry['op'] == 'delete':
-                self.index.delete(entry['key'])
-
-        if entries:
+        """
+        Recover from crash by replaying WAL.
+
+        Only the last logged operation per key affects the final state, so
+        entries are folded per key first. Puts whose record is still intact at
+        the data-file offset logged with them are indexed in place; the rest
+        are appended to the data file once, with a single write.
+        """
+        latest = {}  # key -> (value, offset) of its last put, or None if last deleted
+        for operation, key, value, offset in self.wal.iter_placed():
+            if operation == 'put':
+                latest[key] = (value, offset)
+            elif operation == 'delete':
+                latest[key] = None
+
+        if latest:
+            data_file = self.data_file
+            missing = []
+            for key, entry in latest.items():
+                if entry is None:
+                    self.index.delete_journaled(key)
+                    continue
+                value, offset = entry
+                location = data_file.locate(offset, key, value) if offset is not None else None
+                if location is None:
+                    missing.append((key, value))
+                else:
+                    self.index.put_journaled(key, *location)
+            locations = data_file.append_batch(missing)
+            for (key, _), (offset, length) in zip(missing, locations):
+                self.index.put_journaled(key, offset, length)
             self.index.save()
             self.wal.truncate()
 
@@ -195,34 +281,64 @@ class KVStore:
             if not self.running:
                 break
 
-            with WriteLock(self.rwlock):
-                self.index.save()
-            # Truncate WAL under its own lock after index is saved
-            with self.wal_lock:
-                self.wal.truncate()
-
-    def put(self, key: bytes, value: bytes) -> bool:
-        """Store key-value pair."""
-        try:
-            # Phase 1: Log to WAL under separate lock (doesn't block on readers)
-            with self.wal_lock:
-                self.wal.log('put', key, value)
-
-            # Phase 2: Update data and index under write lock
-            with WriteLock(self.rwlock):
-                # Append to data file
-                offset, length = self.data_file.append(key, value)
+            # Data records are synced first so the index never points past
+            # durable data once the WAL is truncated
+            if self.index.needs_snapshot():
+                # Full snapshot must not race with index updates
+                with self.rwlock.writer:
+                    self.data_file.sync()
+                    self.index.save()
+            else:
+                # Routine checkpoint only syncs the delta journal
+                with self.rwlock.reader:
+                    self.data_file.sync()
+                    self.index.flush()
+            # Truncate WAL after index is saved (waits for an in-flight commit)
+            self.wal.truncate()
 
-                # Update index
-                self.index.put(key, offset, length)
+    def put(self, key: bytes, value: Union[bytes, bytearray, memoryview]) -> bool:
+        """
+        Store key-value pair.
 
-            # Phase 3: Replicate to replicas (if not a replica and replication enabled)
+        value may be any bytes-like object; it is copied straight into the
+        data file buffer and written to the WAL as-is, so a large bytearray or
+        memoryview need not be converted to bytes first.
+        """
+        try:
+            # Phase 1: Place the record in the data file. Not indexed yet, so
+            # readers cannot see it before it is durable in the WAL, and it
+            # only needs the append lock, not the reader-writer lock.
+            with self._append_lock:
+                data_file = self.data_file
+                offset, length = data_file.append(key, value)
+                data_file.flush_group(sync=False)
+
+            # Phase 2: Log to WAL with the record's offset, group-committed with
+            # concurrent writers (doesn't block on readers). Recovery reuses
+            # the record at that offset instead of appending the value again.
+            self.wal.log('put', key, value, offset)
+
+            # Phase 3: Update index under write lock
+            with self.rwlock.writer:
+                if self.data_file is not data_file:
+                    # Compaction swapped files in between; the record was not copied
+                    with self._append_lock:
+                        data_file = self.data_file
+                        offset, length = data_file.append(key, value)
+                        data_file.flush_group(sync=False)
+                self.index.put_journaled(key, offset, length)
+
+            # fsync outside the write lock: readers are not stalled on the disk,
+            # and concurrent writers share one sync
+            data_file.sync(offset + length)
+
+            # Phase 4: Replicate to replicas (if not a replica and replication enabled)
             if self.replicator and not self.is_replica:
                 self.replicator.replicate_put(key, value)
 
             return True
-        except Exception as e:
-            print(f"Error in put: {e}")
+        except Exception:
+            logger.exception("Error in put")
             return False
 
     def batch_put(self, keys: list[bytes], values: list[bytes]) -> bool:
@@ -231,98 +347,127 @@ class KVStore:
             raise ValueError("Keys and values must have the same length")
 
         try:
-            # Phase 1: Log all to WAL under separate lock (doesn't block on readers)
-            with self.wal_lock:
-                for key, value in zip(keys, values):
-                    self.wal.log('put', key, value)
-
-            # Phase 2: Update data and index under write lock
-            with WriteLock(self.rwlock):
-                for key, value in zip(keys, values):
-                    # Append to data file
-                    offset, length = self.data_file.append(key, value)
-
-                    # Update index
-                    self.index.put(key, offset, length)
-
-            # Phase 3: Replicate to replicas (if not a replica and replication enabled)
+            # Phase 1: Place the whole batch in the data file with a single write
+            with self._append_lock:
+                data_file = self.data_file
+                locations = data_file.append_batch(zip(keys, values), sync=False)
+
+            # Phase 2: Log all to WAL, with their offsets, in one group commit
+            self.wal.log_batch([('put', key, value, offset)
+                                for key, value, (offset, _) in zip(keys, values, locations)])
+
+            # Phase 3: Update index under write lock
+            with self.rwlock.writer:
+                if self.data_file is not data_file:
+                    # Compaction swapped files in between; the batch was not copied
+                    with self._append_lock:
+                        data_file = self.data_file
+                        locations = data_file.append_batch(zip(keys, values), sync=False)
+                for key, (offset, length) in zip(keys, locations):
+                    self.index.put_journaled(key, offset, length)
+
+            # Single fsync for the whole batch, outside the write lock
+            data_file.sync()
+
+            # Phase 4: Replicate to replicas (if not a replica and replication enabled)
             if self.replicator and not self.is_replica:
                 self.replicator.replicate_batch_put(keys, values)
 
             return True
-        except Exception as e:
-            print(f"Error in batch_put: {e}")
+        except Exception:
+            logger.exception("Error in batch_put")
             return False
 
     def read(self, key: bytes) -> Optional[bytes]:
-        """Read value for key."""
-        with ReadLock(self.rwlock):
-            try:
-                # Lookup in index
-                location = self.index.get(key)
-                if not location:
-                    return None
+        """
+        Read value for key.
 
-                offset, _ = location
+        Lock-free: a single dict lookup is atomic, records are flushed to the
+        data file before the index points at them, and the data file is never
+        rewritten in place. Compaction swaps index and data file together by
+        replacing self._read_view, and keeps the old file open until the next
+        compaction for readers still using the old view.
+        """
+        try:
+            # Lookup in index
+            index, data_file = self._read_view
+            location = index.get(key)
+            if location is None:
+                return None
 
-                # Read from data file
-                stored_key, value = self.data_file.read(offset)
+            offset, _ = unpack_location(location)
 
-                # Verify key matches
-                if stored_key != key:
-                    return None
+            # Read from data file
+            stored_key, value = data_file.read(offset)
 
-                return value
-            except Exception as e:
-                print(f"Error in read: {e}")
+            # Verify key matches
+            if stored_key != key:
                 return None
 
+            return bytes(value)
+        except Exception:
+            logger.exception("Error in read")
+            return None
+
     def read_key_range(self, start_key: bytes, end_key: bytes) -> dict[bytes, bytes]:
         """Read all key-value pairs within the specified range [start_key, end_key]."""
-        with ReadLock(self.rwlock):
-            try:
-                result = {}
-                # Get all keys in range from index
-                locations = self.index.get_range(start_key, end_key)
+        try:
+            return dict(self.iter_key_range(start_key, end_key))
+        except Exception:
+            logger.exception("Error in read_key_range")
+            return {}
 
-                # Read each key-value pair from data file
-                for key, (offset, _) in locations.items():
-                    stored_key, value = self.data_file.read(offset)
-                    if stored_key == key:
-                        result[key] = value
+    def iter_key_range(self, start_key: bytes, end_key: bytes) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        Yield (key, value) for each key in [start_key, end_key], in key order.
 
-                return result
-            except Exception as e:
-                print(f"Error in read_key_range: {e}")
-                return {}
+        The matching locations are captured under the read lock; records are
+        then read lock-free, like read(), Config.RANGE_READ_CHUNK_SIZE at a
+        time. Each chunk is read in file order, so large scans touch the data
+        file sequentially, and only one chunk of values is held at once.
+        """
+        with self.rwlock.reader:
+            locations = list(self.index.get_range(start_key, end_key).items())
+            data_file = self.data_file
+
+        chunk_size = Config.RANGE_READ_CHUNK_SIZE
+        for i in range(0, len(locations), chunk_size):
+            chunk = locations[i:i + chunk_size]
+            order = sorted(range(len(chunk)), key=lambda j: chunk[j][1][0])
+            records = data_file.read_many(chunk[j][1][0] for j in order)
+            values = [None] * len(chunk)
+            for j, (stored_key, value) in zip(order, records):
+                if stored_key == chunk[j][0]:
+                    values[j] = bytes(value)
+            records = stored_key = value = None
+            for (key, _), value in zip(chunk, values):
+                if value is not None:
+                    yield key, value
 
     def delete(self, key: bytes) -> bool:
         """Delete key from store."""
         try:
-            # Check if key exists first (can use read lock for this check)
-            with ReadLock(self.rwlock):
-                if self.index.get(key) is None:
+            # Phase 1+2: Remove from index and log to WAL under one write lock.
+            # Readers cannot observe the removal before the WAL record is written.
+            # The WAL never takes rwlock, so committing to it here is safe.
+            with self.rwlock.writer:
+                location = self.index.delete_journaled(key)
+                if location is None:
                     return False
-
-            # Phase 1: Log to WAL under separate lock
-            with self.wal_lock:
-                self.wal.log('delete', key)
-
-            # Phase 2: Update index under write lock
-            with WriteLock(self.rwlock):
-                # Double-check key still exists (could have been deleted by another thread)
-                if self.index.get(key) is None:
-                    return False
-                # Remove from index
-                self.index.delete(key)
+                try:
+                    self.wal.log('delete', key)
+                except Exception:
+                    # Undo the removal so the index stays consistent with the WAL
+                    self.index.put_journaled(key, *location)
+                    raise
 
             # Phase 3: Replicate to replicas (if not a replica and replication enabled)
             if self.replicator and not self.is_replica:
                 self.replicator.replicate_delete(key)
 
             return True
-        except Exception as e:
-            print(f"Error in delete: {e}")
+        except Exception:
+            logger.exception("Error in delete")
             return False
 
     def _should_compact(self) -> bool:
@@ -330,83 +475,102 @@ class KVStore:
         if self.data_file.size < Config.COMPACTION_MIN_FILE_SIZE:
             return False  # File too small to bother
         
-        # Acquire read lock to safely iterate index
-        with ReadLock(self.rwlock):
-            if not self.index.index:
-                return False  # Empty index
-            
-            total_size = self.data_file.size
-            if total_size == 0:
-                return False
-            
-            # Calculate live data size
-            live_size = sum(length for offset, length in self.index.index.values())
-            
-            # Calculate dead space ratio
-            dead_ratio = 1 - (live_size / total_size)
-            
-            return dead_ratio >= Config.COMPACTION_THRESHOLD
+        if not self.index.index:
+            return False  # Empty index
+        
+        total_size = self.data_file.size
+        if total_size == 0:
+            return False
+        
+        # Live data size is maintained by the index: no scan, no lock
+        live_size = self.index.live_bytes
+        
+        # Calculate dead space ratio
+        dead_ratio = 1 - (live_size / total_size)
+        
+        return dead_ratio >= Config.COMPACTION_THRESHOLD
 
     def _compact(self):
         """
         Compact the data file to reclaim space from deleted entries.
         Creates a new file with only active (indexed) entries.
         """
-        import time
-        
         start_time = time.time()
-        print(f"[Compaction] Starting compaction...")
+        logger.info("[Compaction] Starting compaction...")
         
-        # Get snapshot of current state
-        with ReadLock(self.rwlock):
-            old_size = self.data_file.size
+        # Get snapshot of current state: just (offset, length, key) tuples, no dict copy
+        with self.rwlock.reader:
+            data_file = self.data_file
+            old_size = data_file.size
             entry_count = len(self.index.index)
-            index_snapshot = self.index.index.copy()
+            index_snapshot = [(*unpack_location(location), key) for key, location in self.index.index.items()]
         
         if not index_snapshot:
-            print(f"[Compaction] No entries to compact")
+            logger.info("[Compaction] No entries to compact")
             return
         
+        # Copy in file order so the old file is read sequentially
+        index_snapshot.sort()
+        
         try:
             # Create temporary compacted file
             temp_path = str(self.data_dir / (Config.DATA_FILENAME + '.compact'))
-            new_datafile = DataFile(temp_path)
             new_index = {}
             
-            # Copy all active entries to new file
+            # Copy all active entries to new file as raw record bytes, merging
+            # adjacent records into one in-kernel copy. No lock is needed: the
+            # old file is append-only and only compaction ever closes it.
             copied = 0
-            for key, (old_offset, old_length) in index_snapshot.items():
-                try:
-                    # Read from old file with read lock
-                    with ReadLock(self.rwlock):
-                        stored_key, value = self.data_file.read(old_offset)
-                    
-                    if stored_key == key:
-                        # Write to new file (no lock needed - separate file)
-                        new_offset, new_length = new_datafile.append(key, value)
-                        new_index[key] = (new_offset, new_length)
-                        copied += 1
-                except Exception as e:
-                    print(f"[Compaction] Error copying entry for key {key}: {e}")
-                    continue
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                new_size = DataFile.write_header(fd)
+                run_start = run_end = None
+                for offset, length, key in index_snapshot:
+                    if offset != run_end:
+                        if run_start is not None:
+                            data_file.copy_to(fd, run_start, run_end - run_start, new_size)
+                            new_size += run_end - run_start
+                        run_start = run_end = offset
+                    new_index[key] = (offset, (new_size + run_end - run_start, length))
+                    run_end += length
+                    copied += 1
+                data_file.copy_to(fd, run_start, run_end - run_start, new_size)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            index_snapshot = None
+            new_datafile = DataFile(temp_path)
             
-            # Now do atomic swap with write lock
-            with WriteLock(self.rwlock):
-                # Check for any updates that happened during compaction
-                for key, (offset, length) in self.index.index.items():
-                    if key not in new_index or self.index.index[key] != index_snapshot.get(key):
+            # Now do atomic swap with write lock (and no append in progress)
+            with self.rwlock.writer, self._append_lock:
+                # Entries still at the offset they were copied from are
+                # unchanged; deleted keys are dropped
+                live_index = {}
+                for key, location in self.index.index.items():
+                    offset, _ = unpack_location(location)
+                    copied_entry = new_index.get(key)
+                    location = copied_entry[1] if copied_entry is not None and copied_entry[0] == offset else None
+                    if location is None:
                         # New or updated entry - copy from current file
                         try:
                             stored_key, value = self.data_file.read(offset)
-                            new_offset, new_length = new_datafile.append(key, value)
-                            new_index[key] = (new_offset, new_length)
+                            location = new_datafile.append(key, value)
                         except Exception as e:
-                            print(f"[Compaction] Error copying updated entry for key {key}: {e}")
+                            logger.error("[Compaction] Error copying updated entry for key %r: %s", key, e)
+                            continue
+                    live_index[key] = location
+                new_index = live_index
                 
-                # Close and swap files
+                # Drop views into the old mapping so it can be unmapped
+                stored_key = value = data_file = None
+
+                # Close the new file (flushing buffered records) and swap files.
+                # The old one is only flushed: a lock-free reader that took the
+                # old read view just before the swap may still pread from it
                 new_datafile.close()
-                old_path = self.data_file.path
-                self.data_file.close()
+                retired = self.data_file
+                old_path = retired.path
+                retired.flush_group()
                 
                 # Backup old file
                 backup_path = str(self.data_dir / (Config.DATA_FILENAME + '.old'))
@@ -419,23 +583,26 @@ class KVStore:
                 
                 # Reopen and update index
                 self.data_file = DataFile(old_path)
-                self.index.index = new_index
-                self.index.save()
+                self.index.replace(new_index)
+                self._read_view = (self.index.index, self.data_file)
+                self.index.save(force=True)
+
+                if self._retired_data_file is not None:
+                    self._retired_data_file.close()
+                self._retired_data_file = retired
             
             # Print statistics
             new_size = self.data_file.size
             reclaimed = old_size - new_size
             duration = time.time() - start_time
             
-            print(f"[Compaction] Completed successfully:")
-            print(f"  Duration: {duration:.2f}s")
-            print(f"  Old size: {old_size:,} bytes")
-            print(f"  New size: {new_size:,} bytes")
-            print(f"  Reclaimed: {reclaimed:,} bytes ({reclaimed/old_size*100:.1f}%)")
-            print(f"  Entries copied: {copied}/{entry_count}")
+            logger.info(
+                "[Compaction] Completed successfully: duration %.2fs, old size %d bytes, "
+                "new size %d bytes, reclaimed %d bytes (%.1f%%), entries copied %d/%d",
+                duration, old_size, new_size, reclaimed, reclaimed / old_size * 100, copied, entry_count)
             
-        except Exception as e:
-            print(f"[Compaction] Failed: {e}")
+        except Exception:
+            logger.exception("[Compaction] Failed")
             # Clean up temporary file if it exists
             try:
                 if os.path.exists(temp_path):
@@ -445,7 +612,8 @@ class KVStore:
 
     def _compaction_loop(self):
         """Background thread that periodically checks and performs compaction."""
-        print(f"[Compaction] Background compaction enabled (check interval: {Config.COMPACTION_INTERVAL}s, threshold: {Config.COMPACTION_THRESHOLD*100}%)")
+        logger.info("[Compaction] Background compaction enabled (check interval: %ss, threshold: %s%%)",
+                    Config.COMPACTION_INTERVAL, Config.COMPACTION_THRESHOLD * 100)
         
         while self.running:
             # Wait for interval or stop event
@@ -458,8 +626,8 @@ class KVStore:
             try:
                 if self._should_compact():
                     self._compact()
-            except Exception as e:
-                print(f"[Compaction] Error in compaction loop: {e}")
+            except Exception:
+                logger.exception("[Compaction] Error in compaction loop")
 
     def __del__(self):
         """Destructor to ensure lock is released even if close() not called."""
@@ -488,8 +656,11 @@ class KVStore:
             self.replica_manager.stop_health_monitoring()
 
         self.index.save()
+        self.index.close()
         self.wal.close()
         self.data_file.close()
+        if self._retired_data_file is not None:
+            self._retired_data_file.close()
         
         # Release directory lock
         self._release_lock()
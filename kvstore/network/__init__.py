@@ -1,6 +1,26 @@
 """Network layer components."""
-from .server import KVServer
-from .client import KVClient, KVClientError
-from .protocol import Protocol
 
-__all__ = ['KVServer', 'KVClient', 'KVClientError', 'Protocol']
+__all__ = ['KVServer', 'KVClient', 'KVConnectionPool', 'KVClientError', 'Protocol']
+
+# Resolved lazily: importing the client must not pull in the server and store.
+_LAZY_IMPORTS = {
+    'KVServer': '.server',
+    'KVClient': '.client',
+    'KVConnectionPool': '.client',
+    'KVClientError': '.client',
+    'Protocol': '.protocol',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,8 +1,27 @@
 """Client for connecting to KV store server."""
+import queue
 import socket
-from typing import Optional
+import struct
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 from ..utils.config import Config
-from .protocol import Protocol
+from .connection import tune_socket
+from .protocol import (Protocol, BINARY_MAGIC, OP_PUT, OP_BATCHPUT, OP_READ, OP_READRANGE, OP_DELETE,
+                       STATUS_OK, STATUS_NOT_FOUND)
+
+# Wire-format constants and escaping helpers, bound once instead of looked up per command
+_DELIMITER = Config.MESSAGE_DELIMITER
+_SEPARATOR = Config.BATCH_SEPARATOR
+_SEPARATOR_STR = _SEPARATOR.decode()
+_FRAME_LENGTH = struct.Struct('!I')
+# Frame length, code and first field's length: the fixed start of a frame whose
+# first field is a key, packed in one call for the single-key commands
+_KEY_FRAME_HEADER = struct.Struct('!IBI')
+_escape = Protocol.escape
+_unescape = Protocol.unescape
+_encode_frame = Protocol.encode_frame
+_decode_fields = Protocol.decode_fields
 
 
 class KVClientError(Exception):
@@ -10,106 +29,514 @@ class KVClientError(Exception):
     pass
 
 
-class KVClient:
-    """Simple client for KV store."""
+class _TextCodec:
+    """Legacy text protocol: newline-delimited commands with escaped values."""
 
-    def __init__(self, host: str = None, port: int = None):
-        self.host = host or Config.CLIENT_HOST
-        self.port = port or Config.CLIENT_PORT
+    preamble = b''
 
-    def _send_command(self, command: bytes) -> bytes:
-        """Send command and receive response."""
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((self.host, self.port))
-                s.sendall(command + Config.MESSAGE_DELIMITER)
-
-                # Read response until we get MESSAGE_DELIMITER
-                buffer = b''
-                while Config.MESSAGE_DELIMITER not in buffer:
-                    chunk = s.recv(Config.CLIENT_RECV_BUFFER)
-                    if not chunk:
-                        break
-                    buffer += chunk
-
-                # Extract the response (everything before the delimiter)
-                if Config.MESSAGE_DELIMITER in buffer:
-                    response, _ = buffer.split(Config.MESSAGE_DELIMITER, 1)
-                else:
-                    response = buffer
-
-                return response.strip()
-        except ConnectionRefusedError:
-            raise KVClientError(
-                f"Cannot connect to server at {self.host}:{self.port}. "
-                f"Is the server running?"
-            )
-        except socket.timeout:
-            raise KVClientError(
-                f"Connection timeout to {self.host}:{self.port}. "
-                f"Server may be overloaded or unreachable."
-            )
-        except socket.gaierror as e:
-            raise KVClientError(
-                f"Cannot resolve hostname '{self.host}': {e}"
-            )
-        except OSError as e:
-            raise KVClientError(
-                f"Network error while connecting to {self.host}:{self.port}: {e}"
-            )
+    @staticmethod
+    def join(commands: List[bytes]) -> bytes:
+        return _DELIMITER.join(commands) + _DELIMITER
 
-    def put(self, key: str, value: str) -> bool:
-        """Put key-value pair."""
-        # Build command purely with bytes - escape the value bytes
-        escaped_value = Protocol.escape(value.encode())
-        command = b'PUT ' + key.encode() + b' ' + escaped_value
-        response = self._send_command(command)
-        return response == b'OK'
+    @staticmethod
+    def next_response(buffer: bytearray, start: int, search_from: int) -> Optional[Tuple[bytes, int]]:
+        """Return the complete response at start and the offset after it, or None."""
+        end = buffer.find(_DELIMITER, max(start, search_from))
+        if end < 0:
+            return None
+        # The response is everything before the delimiter
+        return bytes(memoryview(buffer)[start:end]).strip(), end + len(_DELIMITER)
 
-    def batch_put(self, keys: list[str], values: list[str]) -> bool:
-        """Put multiple key-value pairs in a batch."""
+    @staticmethod
+    def resume_search(buffer: bytearray) -> int:
+        """Offset before which the (unconsumed) buffer holds no response boundary."""
+        return max(0, len(buffer) - len(_DELIMITER) + 1)
+
+    @staticmethod
+    def last_response(buffer: bytearray) -> Optional[bytes]:
+        """Response left unterminated when the server closed the connection."""
+        return bytes(buffer).strip()
+
+    @staticmethod
+    def put_command(key: str, value: str) -> bytes:
+        return b'PUT ' + key.encode() + b' ' + _escape(value.encode())
+
+    @staticmethod
+    def batch_put_command(keys: list[str], values: list[str]) -> bytes:
         if len(keys) != len(values):
             raise ValueError("Keys and values must have the same length")
+        # Joined as str and encoded/escaped once: the separator contains no
+        # escapable bytes, so escaping the joined values equals joining them escaped
+        return (b'BATCHPUT ' + _SEPARATOR_STR.join(keys).encode() + b' '
+                + _escape(_SEPARATOR_STR.join(values).encode()))
+
+    @staticmethod
+    def read_command(key: str) -> bytes:
+        return b'READ ' + key.encode()
+
+    @staticmethod
+    def range_command(start_key: str, end_key: str) -> bytes:
+        return b'READRANGE ' + start_key.encode() + b' ' + end_key.encode()
 
-        # Escape each value before joining - keep as bytes
-        escaped_values = [Protocol.escape(v.encode()) for v in values]
+    @staticmethod
+    def delete_command(key: str) -> bytes:
+        return b'DELETE ' + key.encode()
 
-        # Join keys and values with Config.BATCH_SEPARATOR - all as bytes
-        keys_bytes = Config.BATCH_SEPARATOR.join([k.encode() for k in keys])
-        values_bytes = Config.BATCH_SEPARATOR.join(escaped_values)
-        command = b'BATCHPUT ' + keys_bytes + b' ' + values_bytes
-        response = self._send_command(command)
+    @staticmethod
+    def parse_ok(response: bytes) -> bool:
         return response == b'OK'
 
-    def read(self, key: str) -> Optional[str]:
-        """Read value for key."""
-        command = f'READ {key}'.encode()
-        response = self._send_command(command)
+    @staticmethod
+    def parse_read(response: bytes) -> Optional[str]:
         if response == b'NOT_FOUND':
             return None
         # Unescape the response value
-        return Protocol.unescape(response).decode()
-
-    def read_key_range(self, start_key: str, end_key: str) -> dict[str, str]:
-        """Read all key-value pairs in the range [start_key, end_key]."""
-        command = f'READRANGE {start_key} {end_key}'.encode()
-        response = self._send_command(command)
+        return _unescape(response).decode()
 
+    @staticmethod
+    def parse_range(response: bytes) -> dict[str, str]:
         if response == b'NOT_FOUND':
             return {}
 
-        # Parse response: key1||value1||key2||value2||...
-        parts = response.split(Config.BATCH_SEPARATOR)
-        result = {}
-        for i in range(0, len(parts), 2):
-            if i + 1 < len(parts):
-                key = parts[i].decode()
-                value = Protocol.unescape(parts[i + 1]).decode()
-                result[key] = value
-        return result
+        # Parse response: key1||value1||key2||value2||... (in key order)
+        parts = response.split(_SEPARATOR)
+        return {key.decode(): _unescape(value).decode() for key, value in zip(parts[0::2], parts[1::2])}
+
+
+class _BinaryCodec:
+    """Binary protocol: length-prefixed frames, values sent as-is (see protocol.py)."""
+
+    preamble = BINARY_MAGIC
+
+    @staticmethod
+    def join(commands: List[bytes]) -> bytes:
+        return b''.join(commands)
+
+    @staticmethod
+    def next_response(buffer: bytearray, start: int, search_from: int) -> Optional[Tuple[bytes, int]]:
+        """Return the complete response frame at start (without its length) and the offset after it, or None."""
+        if len(buffer) - start < _FRAME_LENGTH.size:
+            return None
+        (length,) = _FRAME_LENGTH.unpack_from(buffer, start)
+        end = start + _FRAME_LENGTH.size + length
+        if end > len(buffer):
+            return None
+        return bytes(memoryview(buffer)[start + _FRAME_LENGTH.size:end]), end
+
+    @staticmethod
+    def resume_search(buffer: bytearray) -> int:
+        return 0
+
+    @staticmethod
+    def last_response(buffer: bytearray) -> Optional[bytes]:
+        return None  # A partial frame is not a response
+
+    @staticmethod
+    def put_command(key: str, value: str) -> bytes:
+        key = key.encode()
+        value = value.encode()
+        return b''.join((_KEY_FRAME_HEADER.pack(9 + len(key) + len(value), OP_PUT, len(key)), key,
+                         _FRAME_LENGTH.pack(len(value)), value))
+
+    @staticmethod
+    def batch_put_command(keys: list[str], values: list[str]) -> bytes:
+        if len(keys) != len(values):
+            raise ValueError("Keys and values must have the same length")
+        fields = []
+        for key, value in zip(keys, values):
+            fields.append(key.encode())
+            fields.append(value.encode())
+        return _encode_frame(OP_BATCHPUT, fields)
+
+    @staticmethod
+    def read_command(key: str) -> bytes:
+        key = key.encode()
+        return _KEY_FRAME_HEADER.pack(5 + len(key), OP_READ, len(key)) + key
+
+    @staticmethod
+    def range_command(start_key: str, end_key: str) -> bytes:
+        return _encode_frame(OP_READRANGE, [start_key.encode(), end_key.encode()])
+
+    @staticmethod
+    def delete_command(key: str) -> bytes:
+        key = key.encode()
+        return _KEY_FRAME_HEADER.pack(5 + len(key), OP_DELETE, len(key)) + key
+
+    @staticmethod
+    def _check(response: bytes) -> int:
+        """Return the response's status, raising KVClientError for an error response."""
+        if not response:
+            raise KVClientError("Server closed the connection without responding")
+        status = response[0]
+        if status not in (STATUS_OK, STATUS_NOT_FOUND):
+            fields = _decode_fields(response)
+            message = fields[0].decode() if fields else 'unknown error'
+            raise KVClientError(f"Server error: {message}")
+        return status
+
+    @staticmethod
+    def parse_ok(response: bytes) -> bool:
+        return response[:1] == b'\x00'  # STATUS_OK
+
+    @staticmethod
+    def parse_read(response: bytes) -> Optional[str]:
+        if _BinaryCodec._check(response) == STATUS_NOT_FOUND:
+            return None
+        return _decode_fields(response)[0].decode()
+
+    @staticmethod
+    def parse_range(response: bytes) -> dict[str, str]:
+        if _BinaryCodec._check(response) == STATUS_NOT_FOUND:
+            return {}
+        fields = _decode_fields(response)
+        return {key.decode(): value.decode() for key, value in zip(fields[0::2], fields[1::2])}
+
+
+_CODECS = {'text': _TextCodec, 'binary': _BinaryCodec}
+
+
+class _Connection:
+    """One TCP connection to the server plus the bytes read past its last response."""
+
+    def __init__(self, host: str, port: int, codec, timeout: Optional[float] = None):
+        self.host = host
+        self.port = port
+        self.codec = codec
+        self.timeout = timeout  # Socket timeout in seconds; None blocks indefinitely
+        self.sock = None
+        self.buffer = bytearray()
+        self.scratch = None  # Reused recv_into target, allocated on connect
+        self.last_used = 0.0  # time.monotonic() when last returned to its pool
+
+    def close(self):
+        """Close the socket; the next request reconnects."""
+        sock, self.sock = self.sock, None
+        self.buffer = bytearray()
+        self.scratch = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def connect(self) -> socket.socket:
+        """Return the open socket, connecting first if needed."""
+        if self.sock is None:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+            tune_socket(sock)
+            if self.timeout and hasattr(socket, 'TCP_USER_TIMEOUT'):
+                # Also give up on unacknowledged sends to a dead peer after the timeout
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(self.timeout * 1000))
+            if self.codec.preamble:
+                sock.sendall(self.codec.preamble)
+            self.scratch = bytearray(Config.CLIENT_RECV_BUFFER)
+            self.sock = sock
+        return self.sock
+
+    def request(self, commands: List[bytes]) -> Optional[List[bytes]]:
+        """
+        Send commands with one write and read their responses in order.
+        Returns None if the server closed the connection without responding.
+        """
+        sock = self.connect()
+        codec = self.codec
+        sock.sendall(codec.join(commands))
+
+        # Each recv lands in the same preallocated scratch buffer rather than
+        # a freshly allocated bytes object. Received bytes are appended to one
+        # bytearray and each byte is examined only once; consumed responses
+        # are dropped from its front once per recv.
+        responses = []
+        buffer = self.buffer
+        scratch = self.scratch
+        scratch_view = memoryview(scratch)
+        start = 0
+        search_from = 0
+        while len(responses) < len(commands):
+            found = codec.next_response(buffer, start, search_from)
+            if found is None:
+                if start:
+                    del buffer[:start]
+                    start = 0
+                search_from = codec.resume_search(buffer)
+                received = sock.recv_into(scratch)
+                if not received:
+                    # Server closed the connection
+                    self.close()
+                    if not buffer and not responses:
+                        return None
+                    if buffer:
+                        last = codec.last_response(buffer)
+                        if last is not None:
+                            responses.append(last)
+                    if len(responses) < len(commands):
+                        raise ConnectionResetError("Server closed the connection before responding to all commands")
+                    return responses
+                buffer += scratch_view[:received]
+                continue
+            response, start = found
+            responses.append(response)
+
+        del buffer[:start]
+        return responses
+
+    def exchange(self, commands: List[bytes]) -> List[bytes]:
+        """Send commands and read their responses, retrying once if the idle connection was stale."""
+        reused = self.sock is not None
+        try:
+            responses = self.request(commands)
+        except (ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+            responses = None
+        if responses is None and reused:
+            # The idle connection went stale (e.g. server restart); retry once
+            self.close()
+            responses = self.request(commands)
+        return responses if responses is not None else [b''] * len(commands)
+
+
+class KVConnectionPool:
+    """
+    Bounded pool of persistent connections to one server.
+
+    A KVClient normally owns a private pool; passing one shared pool to many
+    short-lived clients (e.g. one per request) lets them reuse the same open
+    connections instead of each connecting anew. At most max_size
+    connections exist; borrowers beyond that wait for a free one. Each
+    connection is opened lazily, and one left idle for longer than
+    Config.CLIENT_POOL_IDLE_TIMEOUT is closed and reopened on its next use.
+    """
+
+    def __init__(self, host: str = None, port: int = None, max_size: int = None, protocol: str = None):
+        self.host = host or Config.CLIENT_HOST
+        self.port = port or Config.CLIENT_PORT
+        max_size = max_size or Config.CLIENT_POOL_SIZE
+        protocol = protocol or Config.CLIENT_PROTOCOL
+        if protocol not in _CODECS:
+            raise ValueError(f"Unknown protocol {protocol!r}; expected one of {sorted(_CODECS)}")
+        self.codec = _CODECS[protocol]
+        self._connections = [_Connection(self.host, self.port, self.codec) for _ in range(max_size)]
+        # Idle connections; LIFO so a warm, already-open connection is reused first
+        self._idle = queue.LifoQueue()
+        for connection in reversed(self._connections):
+            self._idle.put(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @contextmanager
+    def borrow(self) -> Iterator[_Connection]:
+        """Check a connection out for the duration of the with block."""
+        connection = self._idle.get()
+        try:
+            idle_timeout = Config.CLIENT_POOL_IDLE_TIMEOUT
+            if (idle_timeout and connection.sock is not None
+                    and time.monotonic() - connection.last_used > idle_timeout):
+                # Likely dropped by the server or a middlebox by now
+                connection.close()
+            yield connection
+        finally:
+            connection.last_used = time.monotonic()
+            self._idle.put(connection)
+
+    def close(self):
+        """Close the pool's connections. Must not race in-flight commands."""
+        for connection in self._connections:
+            connection.close()
+
+
+class KVClient:
+    """
+    Simple client for KV store.
+
+    Keeps its TCP connections open and reuses them for every command; each
+    connection is opened lazily and re-established if the server closed it.
+    A command checks a connection out of a pool of pool_size connections, so
+    up to pool_size threads can have requests in flight at once (the default
+    of one serializes them). Call close() (or use the client as a context
+    manager) when done.
+
+    Pass pool to share a KVConnectionPool between clients instead; host,
+    port and protocol then come from the pool, and close() leaves it open.
+    """
+
+    def __init__(self, host: str = None, port: int = None, pool_size: int = None, protocol: str = None,
+                 pool: KVConnectionPool = None):
+        self._owns_pool = pool is None
+        if pool is None:
+            pool = KVConnectionPool(host, port, pool_size, protocol)
+        self._pool = pool
+        self.host = pool.host
+        self.port = pool.port
+        self._codec = pool.codec
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close the connections to the server, unless the pool is shared. Must not race in-flight commands."""
+        if self._owns_pool:
+            self._pool.close()
+
+    def _send_many(self, commands: List[bytes]) -> List[bytes]:
+        """Send commands and receive their responses, pipelined over one connection."""
+        with self._pool.borrow() as connection:
+            try:
+                responses = []
+                window = Config.CLIENT_PIPELINE_WINDOW
+                for i in range(0, len(commands), window):
+                    responses.extend(connection.exchange(commands[i:i + window]))
+                return responses
+            except ConnectionRefusedError:
+                connection.close()
+                raise KVClientError(
+                    f"Cannot connect to server at {self.host}:{self.port}. "
+                    f"Is the server running?"
+                )
+            except socket.timeout:
+                connection.close()
+                raise KVClientError(
+                    f"Connection timeout to {self.host}:{self.port}. "
+                    f"Server may be overloaded or unreachable."
+                )
+            except socket.gaierror as e:
+                connection.close()
+                raise KVClientError(
+                    f"Cannot resolve hostname '{self.host}': {e}"
+                )
+            except OSError as e:
+                connection.close()
+                raise KVClientError(
+                    f"Network error while connecting to {self.host}:{self.port}: {e}"
+                )
+
+    def _send_command(self, command: bytes) -> bytes:
+        """Send command and receive response."""
+        return self._send_many([command])[0]
+
+    def pipeline(self) -> 'Pipeline':
+        """
+        Start a pipeline: queued commands are sent back-to-back in one write
+        and their responses read in order, so N commands cost about one round
+        trip instead of N. Results are available from execute() or, when used
+        as a context manager, from the pipeline's results attribute on exit.
+        """
+        return Pipeline(self)
+
+    def put(self, key: str, value: str) -> bool:
+        """Put key-value pair."""
+        codec = self._codec
+        return codec.parse_ok(self._send_command(codec.put_command(key, value)))
+
+    def batch_put(self, keys: list[str], values: list[str]) -> bool:
+        """Put multiple key-value pairs in a batch."""
+        codec = self._codec
+        return codec.parse_ok(self._send_command(codec.batch_put_command(keys, values)))
+
+    def read(self, key: str) -> Optional[str]:
+        """Read value for key."""
+        codec = self._codec
+        return codec.parse_read(self._send_command(codec.read_command(key)))
+
+    def read_key_range(self, start_key: str, end_key: str) -> dict[str, str]:
+        """Read all key-value pairs in the range [start_key, end_key], in key order."""
+        codec = self._codec
+        return codec.parse_range(self._send_command(codec.range_command(start_key, end_key)))
 
     def delete(self, key: str) -> bool:
         """Delete key."""
-        command = f'DELETE {key}'.encode()
-        response = self._send_command(command)
-        return response == b'OK'
+        codec = self._codec
+        return codec.parse_ok(self._send_command(codec.delete_command(key)))
+
+    def batch_read(self, keys: list[str]) -> list[Optional[str]]:
+        """Read several keys in one pipelined round trip; values (or None) come back in key order."""
+        codec = self._codec
+        responses = self._send_many([codec.read_command(key) for key in keys])
+        return [codec.parse_read(response) for response in responses]
+
+    def batch_delete(self, keys: list[str]) -> list[bool]:
+        """Delete several keys in one pipelined round trip; results come back in key order."""
+        codec = self._codec
+        responses = self._send_many([codec.delete_command(key) for key in keys])
+        return [codec.parse_ok(response) for response in responses]
+
+
+class Pipeline:
+    """
+    Commands queued for one pipelined round trip on a KVClient.
+
+    Methods mirror KVClient but only queue the command; execute() sends them
+    all and returns each command's result, in order.
+    """
+
+    def __init__(self, client: KVClient):
+        self._client = client
+        self._commands: List[bytes] = []
+        self._parsers: List[Callable[[bytes], Any]] = []
+        self.results: List[Any] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+        return False
+
+    def __len__(self):
+        return len(self._commands)
+
+    def _queue(self, command: bytes, parser: Callable[[bytes], Any]):
+        self._commands.append(command)
+        self._parsers.append(parser)
+
+    def put(self, key: str, value: str):
+        """Queue a PUT; its result is a bool."""
+        codec = self._client._codec
+        self._queue(codec.put_command(key, value), codec.parse_ok)
+
+    def batch_put(self, keys: list[str], values: list[str]):
+        """Queue a BATCHPUT; its result is a bool."""
+        codec = self._client._codec
+        self._queue(codec.batch_put_command(keys, values), codec.parse_ok)
+
+    def read(self, key: str):
+        """Queue a READ; its result is the value or None."""
+        codec = self._client._codec
+        self._queue(codec.read_command(key), codec.parse_read)
+
+    def read_key_range(self, start_key: str, end_key: str):
+        """Queue a READRANGE; its result is a dict."""
+        codec = self._client._codec
+        self._queue(codec.range_command(start_key, end_key), codec.parse_range)
+
+    def delete(self, key: str):
+        """Queue a DELETE; its result is a bool."""
+        codec = self._client._codec
+        self._queue(codec.delete_command(key), codec.parse_ok)
+
+    def execute(self) -> List[Any]:
+        """Send all queued commands and return their results in order."""
+        commands, parsers = self._commands, self._parsers
+        self._commands, self._parsers = [], []
+        if not commands:
+            self.results = []
+            return self.results
+        responses = self._client._send_many(commands)
+        self.results = [parse(response) for parse, response in zip(parsers, responses)]
+        return self.results
@@ -1,36 +1,245 @@
 """Connection handler for individual clients."""
+import asyncio
 import socket
-from typing import Callable
+import struct
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Union
 from ..utils.config import Config
+from .protocol import BINARY_MAGIC, OP_READ, STATUS_ERROR, Protocol
 
+# Wire-format constant, bound once instead of looked up on Config per message
+_DELIMITER = Config.MESSAGE_DELIMITER
 
-class ConnectionHandler:
-    """Handles individual client connections."""
+# Length prefix of a binary-protocol frame, and the code byte of a READ frame
+_FRAME_LENGTH = struct.Struct('!I')
+_READ_CODE = bytes([OP_READ])
 
-    def __init__(self, client_socket: socket.socket, addr, message_processor: Callable):
-        self.socket = client_socket
-        self.addr = addr
+# Responses to pipelined messages are coalesced into one send; flush early once this many bytes are pending
+_MAX_PENDING_RESPONSE_BYTES = 64 * 1024
+
+
+def tune_socket(sock: socket.socket):
+    """
+    Prepare a connected socket for small request/response messages: disable
+    Nagle's algorithm, so a command or response is sent without waiting for
+    the previous one to be acknowledged, and apply any configured buffer sizes.
+    Keepalive probes are enabled too, so a vanished peer is eventually noticed
+    on an otherwise idle connection.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if Config.SOCKET_RCVBUF:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, Config.SOCKET_RCVBUF)
+    if Config.SOCKET_SNDBUF:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, Config.SOCKET_SNDBUF)
+
+
+class ConnectionHandler(asyncio.Protocol):
+    """
+    Handles one client connection on the server's event loop.
+
+    A connection speaks the text protocol (newline-delimited messages, passed
+    to message_processor) unless it opens with BINARY_MAGIC, in which case it
+    sends length-prefixed frames, passed to frame_processor.
+
+    Messages are answered in order. READ runs directly on the loop (an index
+    lookup and one pread); every other command may block on the WAL fsync or
+    scan many records, so it runs in the server's worker pool while the loop
+    keeps serving other connections. Reading from the client is paused until
+    that command's response has been written.
+
+    Responses to all the messages answered from one received chunk are sent
+    together, so a pipelined batch costs one send instead of one per message.
+    A processor may return a large response as a list of chunks.
+    """
+
+    def __init__(self, message_processor: Callable, frame_processor: Callable, executor: Executor,
+                 on_close: Optional[Callable] = None):
         self.process_message = message_processor
-        self.buffer = b''
+        self.process_frame = frame_processor
+        self.executor = executor
+        self.on_close = on_close  # Called with the handler once its connection is lost
+        self.transport = None
+        self.addr = None
+        self._loop = None
+        self.buffer = bytearray()
+        self._binary = None  # Protocol of the connection, known once its first bytes arrive
+        self._search_from = 0  # Bytes before this are known not to start a delimiter
+        self._busy = False  # A command is running in the worker pool
+        self._write_paused = False
+        self._pending = []  # Response chunks (and delimiters) not yet handed to the transport
+        self._pending_bytes = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info('peername')
+        self._loop = asyncio.get_running_loop()
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            tune_socket(sock)
+
+    def connection_lost(self, exc):
+        if self.on_close is not None:
+            self.on_close(self)
+
+    def data_received(self, data: bytes):
+        self.buffer += data
+        if not self._busy and not self._write_paused:
+            self._process_buffer()
+
+    def close(self):
+        """Close the connection."""
+        if self.transport is not None:
+            self.transport.close()
 
-    def handle(self):
-        """Handle client connection."""
+    def pause_writing(self):
+        # The client is not reading its responses; stop reading its commands
+        self._write_paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self._write_paused = False
+        if not self._busy:
+            # Otherwise reading stays paused until the running command finishes
+            self.transport.resume_reading()
+            self._process_buffer()
+
+    def _process_buffer(self):
+        """Answer complete messages until one needs the worker pool."""
+        buffer = self.buffer
+        if self._binary is None:
+            if not buffer:
+                return
+            if buffer[0] == BINARY_MAGIC[0]:
+                if len(buffer) < len(BINARY_MAGIC):
+                    return
+                self._binary = buffer[:len(BINARY_MAGIC)] == BINARY_MAGIC
+                if self._binary:
+                    del buffer[:len(BINARY_MAGIC)]
+            else:
+                self._binary = False
+
+        if self._binary:
+            self._process_frames()
+        else:
+            self._process_messages()
+        self._flush()
+
+    def _process_messages(self):
+        """Answer complete text-protocol messages (newline-delimited)."""
+        # Hot loop: everything it touches per message is bound to a local
+        buffer = self.buffer
+        find = buffer.find
+        process_message = self.process_message
+        dispatch = self._dispatch
+        delimiter = _DELIMITER
+        delimiter_len = len(delimiter)
+        search_from = self._search_from
+        start = 0
+        exhausted = False  # Stopped because no delimiter is left in the buffer
+        while not self._write_paused:
+            end = find(delimiter, start if start > search_from else search_from)
+            if end < 0:
+                exhausted = True
+                break
+            message = bytes(memoryview(buffer)[start:end])
+            start = end + delimiter_len
+            if not dispatch(process_message, message, message[:5].upper() == b'READ '):
+                break
+        if start:
+            del buffer[:start]
+        # Only a search that ran out proves the buffer holds no delimiter; after
+        # stopping for the worker pool or paused writing, complete messages may
+        # still be queued and must be found again from the start
+        self._search_from = max(0, len(buffer) - delimiter_len + 1) if exhausted else 0
+
+    def _process_frames(self):
+        """Answer complete binary-protocol frames."""
+        buffer = self.buffer
+        process_frame = self.process_frame
+        dispatch = self._dispatch
+        unpack_from = _FRAME_LENGTH.unpack_from
+        header_size = _FRAME_LENGTH.size
+        read_code = _READ_CODE
+        size = len(buffer)
+        start = 0
+        while not self._write_paused and size - start >= header_size:
+            (length,) = unpack_from(buffer, start)
+            end = start + header_size + length
+            if end > size:
+                break
+            frame = bytes(memoryview(buffer)[start + header_size:end])
+            start = end
+            if not dispatch(process_frame, frame, frame[:1] == read_code):
+                break
+        if start:
+            del buffer[:start]
+
+    def _dispatch(self, process: Callable, message: bytes, inline: bool) -> bool:
+        """
+        Answer message on the loop if inline, else hand it to the worker pool.
+        Returns whether the next message can be handled right away.
+        """
+        if inline:
+            self._respond(message, process(message))
+            return True
+        self._busy = True
+        self._flush()
+        self.transport.pause_reading()
+        self.executor.submit(process, message).add_done_callback(
+            lambda future: self._finish_threadsafe(message, future))
+        return False
+
+    def _finish_threadsafe(self, message: bytes, future):
+        """Called on the worker thread: hand the finished command back to the loop."""
+        try:
+            self._loop.call_soon_threadsafe(self._finish, message, future)
+        except RuntimeError:
+            pass  # The server has stopped and its loop is closed
+
+    def _finish(self, message: bytes, future):
+        """Write the response of a command that ran in the worker pool and carry on."""
+        self._busy = False
+        if self.transport.is_closing():
+            return
         try:
-            with self.socket:
-                while True:
-                    chunk = self.socket.recv(Config.CONNECTION_RECV_BUFFER)
-                    if not chunk:
-                        break
-
-                    self.buffer += chunk
-
-                    # Process complete messages (newline-delimited)
-                    while Config.MESSAGE_DELIMITER in self.buffer:
-                        message, self.buffer = self.buffer.split(Config.MESSAGE_DELIMITER, 1)
-                        response = self.process_message(message)
-                        if response is None:
-                            print(f"WARNING: process_message returned None for message: {message}")
-                            response = b'ERROR: Internal server error'
-                        self.socket.sendall(response + Config.MESSAGE_DELIMITER)
+            response = future.result()
         except Exception as e:
-            print(f"Error handling client {self.addr}: {e}")
+            response = self._error(f'Internal error: {e}')
+        self._respond(message, response)
+        if self._write_paused:
+            self._flush()
+        else:
+            self.transport.resume_reading()
+            self._process_buffer()
+
+    def _respond(self, message: bytes, response: Union[bytes, List[bytes]]):
+        if response is None:
+            print(f"WARNING: process_message returned None for message: {message}")
+            response = self._error('Internal server error')
+        if type(response) is list:
+            # A large response in chunks: queued as they are, so they are not
+            # concatenated before the write (and not at all where writelines
+            # uses sendmsg, as it does from Python 3.12)
+            self._pending += response
+            self._pending_bytes += sum(map(len, response))
+        else:
+            self._pending.append(response)
+            self._pending_bytes += len(response)
+        if not self._binary:
+            self._pending.append(_DELIMITER)
+        if self._pending_bytes >= _MAX_PENDING_RESPONSE_BYTES:
+            self._flush()
+
+    def _error(self, message: str) -> bytes:
+        """Encode an error response in the connection's protocol."""
+        if self._binary:
+            return Protocol.encode_frame(STATUS_ERROR, [message.encode()])
+        return Protocol.format_error(message)
+
+    def _flush(self):
+        """Hand pending responses to the transport in one write."""
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self._pending_bytes = 0
+            self.transport.writelines(pending)
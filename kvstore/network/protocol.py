@@ -1,5 +1,30 @@
 """Protocol parsing and formatting."""
-from typing import Tuple, Optional
+import struct
+from typing import List, Tuple, Optional
+
+# Escaped character (after the backslash) -> byte it stands for
+_UNESCAPES = {ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t'}
+
+# Binary protocol. A client selects it by sending BINARY_MAGIC as the first
+# bytes of a connection (a text command never starts with a NUL byte). Every
+# request and response is then a frame, [length u32][code u8][fields], where
+# length counts the code byte and the fields and each field is [length u32][bytes].
+# Keys and values travel as-is: no escaping and no delimiter scanning.
+BINARY_MAGIC = b'\x00KV1'
+FRAME_HEADER = struct.Struct('!IB')
+_FIELD_LENGTH = struct.Struct('!I')
+
+# Request codes
+OP_PUT = 1  # Fields: key, value
+OP_BATCHPUT = 2  # Fields: key1, value1, key2, value2, ...
+OP_READ = 3  # Fields: key
+OP_READRANGE = 4  # Fields: start_key, end_key
+OP_DELETE = 5  # Fields: key
+
+# Response codes
+STATUS_OK = 0  # Fields: the value for OP_READ, key1, value1, ... for OP_READRANGE, else none
+STATUS_NOT_FOUND = 1
+STATUS_ERROR = 2  # Fields: error message
 
 
 class Protocol:
@@ -8,43 +33,74 @@ class Protocol:
     @staticmethod
     def escape(data: bytes) -> bytes:
         """Escape special characters in data."""
+        # Fast path for the common value with no \\, \n, \r or \t. Searching
+        # for an int byte is a bare memchr, several times cheaper than a bytes
+        # needle or a no-op replace() call
+        if 92 not in data and 10 not in data and 13 not in data and 9 not in data:
+            return data
         return data.replace(b'\\', b'\\\\').replace(b'\n', b'\\n').replace(b'\r', b'\\r').replace(b'\t', b'\\t')
 
     @staticmethod
     def unescape(data: bytes) -> bytes:
         """Unescape special characters in data."""
-        # Use placeholder to avoid double-unescaping
-        # First replace \\\\ with a placeholder that won't appear in data
-        data = data.replace(b'\\\\', b'\x00')  # NULL byte as placeholder
-        data = data.replace(b'\\n', b'\n')
-        data = data.replace(b'\\r', b'\r')
-        data = data.replace(b'\\t', b'\t')
-        data = data.replace(b'\x00', b'\\')  # Restore backslashes
-        return data
+        if 92 not in data:  # No backslash, nothing to unescape
+            return data
+        # Densely escaped data (more than one escape per 32 bytes) without an
+        # escaped backslash goes through replace(): each call costs a few ns
+        # per byte, against well over 100 ns per escape for the loop below
+        if data.count(92) * 32 > len(data) and b'\\\\' not in data:
+            if b'\\n' in data:
+                data = data.replace(b'\\n', b'\n')
+            if b'\\r' in data:
+                data = data.replace(b'\\r', b'\r')
+            if b'\\t' in data:
+                data = data.replace(b'\\t', b'\t')
+            return data
+        # One pass over the backslash-separated pieces: every piece after the
+        # first starts with an escaped character, except that an empty piece
+        # is an escaped backslash, whose following piece is literal
+        parts = data.split(b'\\')
+        out = [parts[0]]
+        unescapes = _UNESCAPES
+        i = 1
+        n = len(parts)
+        while i < n:
+            part = parts[i]
+            if not part:
+                out.append(b'\\')
+                i += 1
+                if i < n:
+                    out.append(parts[i])
+            else:
+                char = unescapes.get(part[0])
+                out.append(char + part[1:] if char is not None else b'\\' + part)
+            i += 1
+        return b''.join(out)
 
     @staticmethod
-    def _parse_replicate_command(message: bytes) -> Tuple[str, Optional[bytes], Optional[bytes]]:
-        """Parse REPLICATE command from master to replica."""
-        subparts = message.split(b' ', 3)
-        if len(subparts) < 2:
+    def _parse_replicate_command(parts: List[bytes]) -> Tuple[str, Optional[bytes], Optional[bytes]]:
+        """Parse REPLICATE command from master to replica, given parse_command's split."""
+        if len(parts) < 2:
             raise ValueError('REPLICATE requires subcommand')
 
-        subcommand = subparts[1].upper().decode('utf-8')
+        subcommand = parts[1].upper().decode('utf-8')
+        # Only the tail after the subcommand is split again, not the whole message
+        args = parts[2].split(b' ', 1) if len(parts) == 3 else []
 
         if subcommand == 'PUT':
-            if len(subparts) != 4:
+            if len(args) != 2:
                 raise ValueError('REPLICATE PUT requires key and value')
-            return f'REPLICATE_{subcommand}', subparts[2], subparts[3]
+            return f'REPLICATE_{subcommand}', args[0], args[1]
 
         elif subcommand == 'BATCHPUT':
-            if len(subparts) != 4:
+            if len(args) != 2:
                 raise ValueError('REPLICATE BATCHPUT requires keys and values')
-            return f'REPLICATE_{subcommand}', subparts[2], subparts[3]
+            return f'REPLICATE_{subcommand}', args[0], args[1]
 
         elif subcommand == 'DELETE':
-            if len(subparts) != 3:
+            if len(args) != 1:
                 raise ValueError('REPLICATE DELETE requires key')
-            return f'REPLICATE_{subcommand}', subparts[2], None
+            return f'REPLICATE_{subcommand}', args[0], None
 
         else:
             raise ValueError(f'Unknown REPLICATE subcommand: {subcommand}')
@@ -88,21 +144,48 @@ class Protocol:
         For REPLICATE: returns ('REPLICATE_<subcommand>', key, value) - handles master-to-replica commands
         """
         parts = message.split(b' ', 2)
-        command = parts[0].upper().decode('utf-8')
-
-        # Dispatch to specific parsers
-        if command == 'REPLICATE':
-            return Protocol._parse_replicate_command(message)
-        elif command == 'PUT':
-            return Protocol._parse_put_command(parts)
-        elif command == 'BATCHPUT':
-            return Protocol._parse_batchput_command(parts)
-        elif command == 'READRANGE':
-            return Protocol._parse_readrange_command(parts)
-        elif command in ('READ', 'DELETE'):
-            return Protocol._parse_simple_command(command, parts)
-        else:
-            raise ValueError(f'Unknown command: {command}')
+        parse = _PARSERS.get(parts[0])
+        if parse is None:
+            command = parts[0].upper()
+            parse = _PARSERS.get(command)
+            if parse is None:
+                raise ValueError(f'Unknown command: {command.decode("utf-8")}')
+        return parse(message, parts)
+
+    @staticmethod
+    def encode_frame(code: int, fields: List[bytes] = ()) -> bytes:
+        """Build a binary-protocol frame from a request or response code and its fields."""
+        return b''.join(Protocol.encode_frame_parts(code, fields))
+
+    @staticmethod
+    def encode_frame_parts(code: int, fields: List[bytes] = ()) -> List[bytes]:
+        """Like encode_frame, but return the frame as a list of chunks instead of joining them."""
+        parts = [b'']
+        length = 1
+        pack = _FIELD_LENGTH.pack
+        for field in fields:
+            parts.append(pack(len(field)))
+            parts.append(field)
+            length += 4 + len(field)
+        parts[0] = FRAME_HEADER.pack(length, code)
+        return parts
+
+    @staticmethod
+    def decode_fields(frame: bytes, pos: int = 1) -> List[bytes]:
+        """Split a frame's fields, starting after its code byte (frame excludes the length)."""
+        fields = []
+        unpack_from = _FIELD_LENGTH.unpack_from
+        end = len(frame)
+        while pos < end:
+            if pos + 4 > end:
+                raise ValueError('Truncated field in frame')
+            (length,) = unpack_from(frame, pos)
+            pos += 4
+            if pos + length > end:
+                raise ValueError('Truncated field in frame')
+            fields.append(frame[pos:pos + length])
+            pos += length
+        return fields
 
     @staticmethod
     def format_response(success: bool, data: Optional[bytes] = None) -> bytes:
@@ -120,3 +203,15 @@ class Protocol:
     def format_error(message: str) -> bytes:
         """Format error message."""
         return f'ERROR: {message}'.encode()
+
+
+# Command name -> parser taking (message, parts), so a message costs one dict
+# lookup instead of decoding the name and comparing it against each command
+_PARSERS = {
+    b'REPLICATE': lambda message, parts: Protocol._parse_replicate_command(parts),
+    b'PUT': lambda message, parts: Protocol._parse_put_command(parts),
+    b'BATCHPUT': lambda message, parts: Protocol._parse_batchput_command(parts),
+    b'READRANGE': lambda message, parts: Protocol._parse_readrange_command(parts),
+    b'READ': lambda message, parts: Protocol._parse_simple_command('READ', parts),
+    b'DELETE': lambda message, parts: Protocol._parse_simple_command('DELETE', parts),
+}
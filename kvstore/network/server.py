@@ -1,12 +1,45 @@
 """Network server for KV store."""
+import asyncio
 import socket
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
 
 from ..core.store import KVStore
-from .protocol import Protocol
+from .protocol import (Protocol, OP_PUT, OP_BATCHPUT, OP_READ, OP_READRANGE, OP_DELETE,
+                       STATUS_OK, STATUS_NOT_FOUND, STATUS_ERROR)
 from .connection import ConnectionHandler
 from ..utils.config import Config
 
+try:
+    import uvloop  # Optional: pip install kvstore[uvloop]
+except ImportError:
+    uvloop = None
+
+# Wire-format constant, bound once instead of looked up on Config per request
+_SEPARATOR = Config.BATCH_SEPARATOR
+
+_READ_ONLY_ERROR = 'Replica nodes are read-only. Please send writes to the master node.'
+
+# Text-protocol responses that never vary, built once instead of per request
+_OK_RESPONSE = Protocol.format_response(True)
+_FAILED_RESPONSE = Protocol.format_response(False)
+_NOT_FOUND_RESPONSE = Protocol.format_not_found()
+_READ_ONLY_RESPONSE = Protocol.format_error(_READ_ONLY_ERROR)
+
+# Binary-protocol responses without fields, encoded once
+_OK_FRAME = Protocol.encode_frame(STATUS_OK)
+_NOT_FOUND_FRAME = Protocol.encode_frame(STATUS_NOT_FOUND)
+_WRITE_FAILED_FRAME = Protocol.encode_frame(STATUS_ERROR, [b'Write failed'])
+_READ_ONLY_FRAME = Protocol.encode_frame(STATUS_ERROR, [_READ_ONLY_ERROR.encode()])
+
+
+class _RejectedConnection(asyncio.Protocol):
+    """A connection beyond Config.SERVER_MAX_CONNECTIONS: closed as soon as it is accepted."""
+
+    def connection_made(self, transport):
+        transport.close()
+
 
 class KVServer:
     """Network server for KV store using simple text protocol."""
@@ -19,103 +52,114 @@ class KVServer:
         self.server_socket = None
         self.protocol = Protocol()
         self.running = False
+        self._executor = None
+        self._handlers = set()  # Open connections, closed when the server stops
+        self._loop = None  # Event loop serving connections, once start() has created it
+        self._stop_event = None  # Set on the loop to make _serve() return
+        self._stopped = threading.Event()  # Set once the loop and worker pool have finished
 
     def _handle_replicate_put(self, key: bytes, value: bytes) -> bytes:
         """Handle REPLICATE_PUT command."""
-        success = self.store.put(key, value)
-        return self.protocol.format_response(success)
+        success = self.store.put(key, self.protocol.unescape(value))
+        return _OK_RESPONSE if success else _FAILED_RESPONSE
 
     def _handle_replicate_batchput(self, key: bytes, value: bytes) -> bytes:
         """Handle REPLICATE_BATCHPUT command."""
-        keys = key.split(Config.BATCH_SEPARATOR)
-        values = value.split(Config.BATCH_SEPARATOR)
+        keys = key.split(_SEPARATOR)
+        # Unescaped in one pass and then split: escape sequences never decode
+        # to separator bytes, so this equals unescaping each value separately
+        values = self.protocol.unescape(value).split(_SEPARATOR)
         if len(keys) != len(values):
             return self.protocol.format_error('Keys and values count mismatch')
-        unescaped_values = [self.protocol.unescape(v) for v in values]
-        success = self.store.batch_put(keys, unescaped_values)
-        return self.protocol.format_response(success)
+        success = self.store.batch_put(keys, values)
+        return _OK_RESPONSE if success else _FAILED_RESPONSE
 
     def _handle_replicate_delete(self, key: bytes) -> bytes:
         """Handle REPLICATE_DELETE command."""
         success = self.store.delete(key)
-        return self.protocol.format_response(success)
+        return _OK_RESPONSE if success else _FAILED_RESPONSE
 
     def _handle_put(self, key: bytes, value: bytes) -> bytes:
         """Handle PUT command."""
         if self.is_replica:
-            return self.protocol.format_error('Replica nodes are read-only. Please send writes to the master node.')
+            return _READ_ONLY_RESPONSE
         success = self.store.put(key, value)
-        return self.protocol.format_response(success)
+        return _OK_RESPONSE if success else _FAILED_RESPONSE
 
     def _handle_batchput(self, key: bytes, value: bytes) -> bytes:
         """Handle BATCHPUT command."""
         if self.is_replica:
-            return self.protocol.format_error('Replica nodes are read-only. Please send writes to the master node.')
-        keys = key.split(Config.BATCH_SEPARATOR)
-        values = value.split(Config.BATCH_SEPARATOR)
+            return _READ_ONLY_RESPONSE
+        keys = key.split(_SEPARATOR)
+        # Unescaped in one pass and then split: escape sequences never decode
+        # to separator bytes, so this equals unescaping each value separately
+        values = self.protocol.unescape(value).split(_SEPARATOR)
         if len(keys) != len(values):
             return self.protocol.format_error('Keys and values count mismatch')
-        unescaped_values = [self.protocol.unescape(v) for v in values]
-        success = self.store.batch_put(keys, unescaped_values)
-        return self.protocol.format_response(success)
+        success = self.store.batch_put(keys, values)
+        return _OK_RESPONSE if success else _FAILED_RESPONSE
 
     def _handle_read(self, key: bytes) -> bytes:
         """Handle READ command."""
         result = self.store.read(key)
         if result is not None:
-            escaped_result = self.protocol.escape(result)
-            return self.protocol.format_response(True, escaped_result)
-        return self.protocol.format_not_found()
+            # A found value is the response itself (see Protocol.format_response)
+            return self.protocol.escape(result)
+        return _NOT_FOUND_RESPONSE
 
-    def _handle_readrange(self, start_key: bytes, end_key: bytes) -> bytes:
+    def _handle_readrange(self, start_key: bytes, end_key: bytes) -> Union[bytes, List[bytes]]:
         """Handle READRANGE command."""
-        results = self.store.read_key_range(start_key, end_key)
-        if results:
-            pairs = []
-            for k, v in sorted(results.items()):
-                pairs.extend([k, self.protocol.escape(v)])
-            response = Config.BATCH_SEPARATOR.join(pairs)
-            return self.protocol.format_response(True, response)
-        return self.protocol.format_not_found()
+        # Pairs arrive in key order straight from the store's range scan. The
+        # response is returned as a list of chunks, separators included, so it
+        # is only concatenated when the connection writes it out
+        escape = self.protocol.escape
+        parts = []
+        append = parts.append
+        for key, value in self.store.iter_key_range(start_key, end_key):
+            append(key)
+            append(_SEPARATOR)
+            append(escape(value))
+            append(_SEPARATOR)
+        if parts:
+            parts.pop()
+            return parts
+        return _NOT_FOUND_RESPONSE
 
     def _handle_delete(self, key: bytes) -> bytes:
         """Handle DELETE command."""
         if self.is_replica:
-            return self.protocol.format_error('Replica nodes are read-only. Please send writes to the master node.')
+            return _READ_ONLY_RESPONSE
         success = self.store.delete(key)
-        if success:
-            return self.protocol.format_response(True)
-        return self.protocol.format_not_found()
+        return _OK_RESPONSE if success else _NOT_FOUND_RESPONSE
 
-    def _process_message(self, message: bytes) -> bytes:
-        """Process client message."""
+    def _process_message(self, message: bytes) -> Union[bytes, List[bytes]]:
+        """Process client message. Large responses may come back as a list of chunks."""
         try:
             command, key, value = self.protocol.parse_command(message)
 
-            # Build command handlers based on node type
+            # Plain comparisons, most frequent commands first: cheaper than
+            # building or hashing into a handler table for every message
+            if command == 'READ':
+                return self._handle_read(key)
+            if command == 'PUT':
+                return self._handle_put(key, value)
+            if command == 'DELETE':
+                return self._handle_delete(key)
+            if command == 'BATCHPUT':
+                return self._handle_batchput(key, value)
+            if command == 'READRANGE':
+                return self._handle_readrange(key, value)
+
             if command.startswith('REPLICATE_'):
                 # Handle REPLICATE commands (only on replica nodes)
                 if not self.is_replica:
                     return self.protocol.format_error('REPLICATE commands only accepted on replica nodes')
-
-                command_handlers = {
-                    'REPLICATE_PUT': lambda: self._handle_replicate_put(key, value),
-                    'REPLICATE_BATCHPUT': lambda: self._handle_replicate_batchput(key, value),
-                    'REPLICATE_DELETE': lambda: self._handle_replicate_delete(key),
-                }
-            else:
-                # Handle regular commands
-                command_handlers = {
-                    'PUT': lambda: self._handle_put(key, value),
-                    'BATCHPUT': lambda: self._handle_batchput(key, value),
-                    'READ': lambda: self._handle_read(key),
-                    'READRANGE': lambda: self._handle_readrange(key, value),
-                    'DELETE': lambda: self._handle_delete(key),
-                }
-
-            handler = command_handlers.get(command)
-            if handler:
-                return handler()
+                if command == 'REPLICATE_PUT':
+                    return self._handle_replicate_put(key, value)
+                if command == 'REPLICATE_BATCHPUT':
+                    return self._handle_replicate_batchput(key, value)
+                if command == 'REPLICATE_DELETE':
+                    return self._handle_replicate_delete(key)
 
             return self.protocol.format_error(f'Unknown command: {command}')
 
@@ -124,18 +168,83 @@ class KVServer:
         except Exception as e:
             return self.protocol.format_error(f'Internal error: {str(e)}')
 
-    def _handle_client(self, client_socket: socket.socket, addr):
-        """Handle individual client connection."""
-        handler = ConnectionHandler(client_socket, addr, self._process_message)
-        handler.handle()
+    def _process_frame(self, frame: bytes) -> Union[bytes, List[bytes]]:
+        """
+        Process one binary-protocol request (its code byte and fields, without
+        the length prefix) and return the encoded response frame, or for a
+        range read the frame's chunks.
+        """
+        protocol = self.protocol
+        try:
+            if not frame:
+                raise ValueError('Empty frame')
+            op = frame[0]
+            fields = protocol.decode_fields(frame)
+
+            if op == OP_READ:
+                if len(fields) != 1:
+                    raise ValueError('READ requires key')
+                value = self.store.read(fields[0])
+                return _NOT_FOUND_FRAME if value is None else protocol.encode_frame(STATUS_OK, [value])
+            if op == OP_READRANGE:
+                if len(fields) != 2:
+                    raise ValueError('READRANGE requires start_key and end_key')
+                pairs = []
+                for item in self.store.iter_key_range(fields[0], fields[1]):
+                    pairs.extend(item)
+                return protocol.encode_frame_parts(STATUS_OK, pairs)
+
+            if op not in (OP_PUT, OP_BATCHPUT, OP_DELETE):
+                raise ValueError(f'Unknown request code: {op}')
+            if self.is_replica:
+                return _READ_ONLY_FRAME
+            if op == OP_PUT:
+                if len(fields) != 2:
+                    raise ValueError('PUT requires key and value')
+                success = self.store.put(fields[0], fields[1])
+            elif op == OP_BATCHPUT:
+                if len(fields) % 2:
+                    raise ValueError('Keys and values count mismatch')
+                success = self.store.batch_put(fields[0::2], fields[1::2])
+            else:
+                if len(fields) != 1:
+                    raise ValueError('DELETE requires key')
+                return _OK_FRAME if self.store.delete(fields[0]) else _NOT_FOUND_FRAME
+            return _OK_FRAME if success else _WRITE_FAILED_FRAME
+
+        except ValueError as e:
+            return protocol.encode_frame(STATUS_ERROR, [str(e).encode()])
+        except Exception as e:
+            return protocol.encode_frame(STATUS_ERROR, [f'Internal error: {str(e)}'.encode()])
+
+    def _handle_client(self) -> asyncio.Protocol:
+        """Create the protocol handling one client connection."""
+        max_connections = Config.SERVER_MAX_CONNECTIONS
+        if max_connections and len(self._handlers) >= max_connections:
+            return _RejectedConnection()
+        handler = ConnectionHandler(self._process_message, self._process_frame, self._executor,
+                                    on_close=self._handlers.discard)
+        self._handlers.add(handler)
+        return handler
+
+    async def _serve(self):
+        """Serve connections on the listening socket until stop() is called."""
+        self._stop_event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        server = await self._loop.create_server(self._handle_client, sock=self.server_socket)
+        try:
+            if self.running:
+                await self._stop_event.wait()
+        finally:
+            server.close()
+            for handler in list(self._handlers):
+                handler.close()
 
     def start(self):
         """Start the server."""
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            # Set timeout to allow periodic checking for shutdown
-            self.server_socket.settimeout(Config.SERVER_TIMEOUT)
             self.server_socket.bind((self.host, self.port))
             self.server_socket.listen(Config.SERVER_BACKLOG)
 
@@ -143,25 +252,25 @@ class KVServer:
             print(f"KV Store server listening on {self.host}:{self.port}")
             print("Press Ctrl+C to stop the server")
 
+            # One event loop multiplexes all client connections; commands that
+            # may block run on a bounded pool of worker threads
+            self._executor = ThreadPoolExecutor(max_workers=Config.SERVER_WORKER_THREADS,
+                                                thread_name_prefix='kvstore-worker')
             try:
-                while self.running:
+                if uvloop is not None and Config.SERVER_USE_UVLOOP:
+                    # libuv-based loop: cheaper socket I/O and callbacks than asyncio's own
+                    loop = uvloop.new_event_loop()
                     try:
-                        client_socket, addr = self.server_socket.accept()
-                        # Handle each client in a separate thread
-                        client_thread = threading.Thread(
-                            target=self._handle_client,
-                            args=(client_socket, addr),
-                            daemon=True
-                        )
-                        client_thread.start()
-                    except socket.timeout:
-                        # Timeout allows us to check self.running flag
-                        continue
-                    except OSError:
-                        # Socket was closed, exit loop
-                        break
+                        loop.run_until_complete(self._serve())
+                    finally:
+                        loop.close()
+                else:
+                    asyncio.run(self._serve())
             except KeyboardInterrupt:
                 print("\nShutting down...")
+            finally:
+                self._executor.shutdown(wait=True)
+                self._stopped.set()
         except Exception as e:
             print(f"Error starting server: {e}")
         finally:
@@ -170,13 +279,15 @@ class KVServer:
     def stop(self):
         """Stop the server."""
         self.running = False
-        if self.server_socket:
+        loop = self._loop
+        if loop is not None:
             try:
-                # Shutdown the socket to unblock accept()
-                self.server_socket.shutdown(socket.SHUT_RDWR)
-            except OSError:
-                # Socket might already be closed or not connected
-                pass
+                loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass  # Loop already closed
+            # Let in-flight commands finish before the store is closed
+            self._stopped.wait(timeout=Config.SERVER_STOP_TIMEOUT)
+        if self.server_socket:
             try:
                 self.server_socket.close()
             except OSError:
@@ -1,20 +1,50 @@
 """Replica node management."""
+import logging
+import socket
 import threading
 import time
-from typing import List, Set, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+def _isoformat(timestamp: Optional[float], now: Tuple[float, float]) -> Optional[str]:
+    """Convert a time.monotonic() timestamp to wall-clock ISO format, given (time.time(), time.monotonic()) now."""
+    if timestamp is None:
+        return None
+    wall_now, monotonic_now = now
+    return datetime.fromtimestamp(wall_now - (monotonic_now - timestamp)).isoformat()
+
+
+@dataclass(slots=True, eq=False)
 class ReplicaNode:
-    """Represents a replica node."""
+    """Represents a replica node. Slotted: no per-instance __dict__, faster attribute access."""
     host: str
     port: int
-    is_healthy: bool = True
-    last_success: datetime = field(default_factory=datetime.now)
-    last_failure: datetime = None
+    # time.monotonic() timestamps: cheap to take on every replicated operation;
+    # converted to wall-clock time only for get_status()
+    last_success: float = field(default_factory=time.monotonic)
+    last_failure: Optional[float] = None
     consecutive_failures: int = 0
+    # Called when is_healthy changes, so a ReplicaManager can refresh its cached healthy set
+    on_health_change: Optional[Callable[[], None]] = field(default=None, repr=False, compare=False)
+    _healthy: bool = field(default=True, init=False, repr=False)
+
+    @property
+    def is_healthy(self) -> bool:
+        """Whether replication is currently sent to this replica."""
+        return self._healthy
+
+    @is_healthy.setter
+    def is_healthy(self, healthy: bool):
+        # A property rather than a plain field so that only health changes,
+        # not the per-operation bookkeeping writes, run the callback
+        changed = healthy != self._healthy
+        self._healthy = healthy
+        if changed and self.on_health_change is not None:
+            self.on_health_change()
 
     @property
     def address(self) -> Tuple[str, int]:
@@ -41,12 +71,14 @@ class ReplicaManager:
             max_failures: Maximum consecutive failures before marking unhealthy
             health_check_interval: Seconds between health checks
         """
-        self.replicas: Set[ReplicaNode] = set()
+        self.replicas: Dict[Tuple[str, int], ReplicaNode] = {}
+        self._healthy: Tuple[ReplicaNode, ...] = ()  # Cached; rebuilt when membership or health changes
         self.max_failures = max_failures
         self.health_check_interval = health_check_interval
         self.lock = threading.RLock()
         self.running = False
         self.health_check_thread = None
+        self._stop = threading.Event()
 
     def add_replica(self, host: str, port: int) -> ReplicaNode:
         """
@@ -60,14 +92,11 @@ class ReplicaManager:
             The ReplicaNode object
         """
         with self.lock:
-            # Check if already exists
-            for replica in self.replicas:
-                if replica.host == host and replica.port == port:
-                    return replica
-
-            # Create new replica
-            replica = ReplicaNode(host=host, port=port)
-            self.replicas.add(replica)
+            replica = self.replicas.get((host, port))
+            if replica is None:
+                replica = ReplicaNode(host=host, port=port, on_health_change=self._refresh_healthy)
+                self.replicas[(host, port)] = replica
+                self._refresh_healthy()
             return replica
 
     def remove_replica(self, host: str, port: int) -> bool:
@@ -82,21 +111,26 @@ class ReplicaManager:
             True if removed, False if not found
         """
         with self.lock:
-            for replica in self.replicas:
-                if replica.host == host and replica.port == port:
-                    self.replicas.remove(replica)
-                    return True
-            return False
-
-    def get_healthy_replicas(self) -> List[ReplicaNode]:
-        """Get list of currently healthy replicas."""
+            replica = self.replicas.pop((host, port), None)
+            if replica is None:
+                return False
+            replica.on_health_change = None
+            self._refresh_healthy()
+            return True
+
+    def _refresh_healthy(self):
+        """Rebuild the cached tuple of healthy replicas."""
         with self.lock:
-            return [r for r in self.replicas if r.is_healthy]
+            self._healthy = tuple(r for r in self.replicas.values() if r.is_healthy)
+
+    def get_healthy_replicas(self) -> Tuple[ReplicaNode, ...]:
+        """Get currently healthy replicas (a cached tuple; no lock or copy per call)."""
+        return self._healthy
 
     def get_all_replicas(self) -> List[ReplicaNode]:
         """Get list of all replicas."""
         with self.lock:
-            return list(self.replicas)
+            return list(self.replicas.values())
 
     def mark_success(self, replica: ReplicaNode):
         """
@@ -106,11 +140,11 @@ class ReplicaManager:
             replica: The replica node
         """
         with self.lock:
-            replica.last_success = datetime.now()
+            replica.last_success = time.monotonic()
             replica.consecutive_failures = 0
             if not replica.is_healthy:
                 replica.is_healthy = True
-                print(f"[ReplicaManager] Replica {replica.host}:{replica.port} is now healthy")
+                logger.info("[ReplicaManager] Replica %s:%d is now healthy", replica.host, replica.port)
 
     def mark_failure(self, replica: ReplicaNode):
         """
@@ -120,13 +154,13 @@ class ReplicaManager:
             replica: The replica node
         """
         with self.lock:
-            replica.last_failure = datetime.now()
+            replica.last_failure = time.monotonic()
             replica.consecutive_failures += 1
 
             if replica.consecutive_failures >= self.max_failures and replica.is_healthy:
                 replica.is_healthy = False
-                msg = f"Replica {replica.host}:{replica.port} marked unhealthy after {replica.consecutive_failures} failures"
-                print(f"[ReplicaManager] {msg}")
+                logger.warning("[ReplicaManager] Replica %s:%d marked unhealthy after %d failures",
+                               replica.host, replica.port, replica.consecutive_failures)
 
     def start_health_monitoring(self):
         """Start background health check thread."""
@@ -134,6 +168,7 @@ class ReplicaManager:
             return
 
         self.running = True
+        self._stop.clear()
         self.health_check_thread = threading.Thread(
             target=self._health_check_loop,
             daemon=True
@@ -143,15 +178,27 @@ class ReplicaManager:
     def stop_health_monitoring(self):
         """Stop background health check thread."""
         self.running = False
+        self._stop.set()
         if self.health_check_thread:
             self.health_check_thread.join(timeout=2)
 
     def _health_check_loop(self):
-        """Background loop for health checking."""
-        while self.running:
-            time.sleep(self.health_check_interval)
-            # In a more sophisticated implementation, we would actively
-            # ping replicas here. For now, we rely on passive failure detection.
+        """
+        Background loop for health checking.
+
+        Failures are still detected passively, from replication attempts;
+        this loop probes unhealthy replicas with a TCP connect and marks
+        them healthy again once they accept connections.
+        """
+        while not self._stop.wait(self.health_check_interval):
+            for replica in self.get_all_replicas():
+                if replica.is_healthy:
+                    continue
+                try:
+                    socket.create_connection((replica.host, replica.port), timeout=1).close()
+                except OSError:
+                    continue
+                self.mark_success(replica)
 
     def get_status(self) -> dict:
         """
@@ -160,19 +207,20 @@ class ReplicaManager:
         Returns:
             Dictionary with replica status information
         """
+        now = time.time(), time.monotonic()
         with self.lock:
             return {
                 'total_replicas': len(self.replicas),
-                'healthy_replicas': len([r for r in self.replicas if r.is_healthy]),
+                'healthy_replicas': len(self._healthy),
                 'replicas': [
                     {
                         'host': r.host,
                         'port': r.port,
                         'healthy': r.is_healthy,
                         'consecutive_failures': r.consecutive_failures,
-                        'last_success': r.last_success.isoformat() if r.last_success else None,
-                        'last_failure': r.last_failure.isoformat() if r.last_failure else None,
+                        'last_success': _isoformat(r.last_success, now),
+                        'last_failure': _isoformat(r.last_failure, now),
                     }
-                    for r in self.replicas
+                    for r in self.replicas.values()
                 ]
             }
@@ -1,13 +1,45 @@
 """Replicator for asynchronous data replication."""
-import socket
+import logging
 import threading
 import time
-from queue import Queue, Empty
-from typing import Optional, List
+from queue import SimpleQueue, Empty, Full
+from typing import Optional, List, Tuple, Union
 
 from .replica_manager import ReplicaManager, ReplicaNode
+from ..network.client import _Connection, _TextCodec
+from ..network.protocol import Protocol
 from ..utils.config import Config
 
+_SEPARATOR = Config.BATCH_SEPARATOR
+
+# A replica outage fails every queued operation the same way; repeats of a
+# message within this many seconds are dropped rather than logged
+_LOG_REPEAT_WINDOW = 10.0
+
+
+class _RepeatFilter(logging.Filter):
+    """Drops log records identical to one let through within the last window seconds."""
+
+    def __init__(self, window: float):
+        super().__init__()
+        self.window = window
+        self._last_seen = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.levelno, record.getMessage())
+        now = time.monotonic()
+        last = self._last_seen.get(key)
+        if last is not None and now - last < self.window:
+            return False
+        if len(self._last_seen) >= 1024:
+            self._last_seen.clear()
+        self._last_seen[key] = now
+        return True
+
+
+logger = logging.getLogger(__name__)
+logger.addFilter(_RepeatFilter(_LOG_REPEAT_WINDOW))
+
 
 class ReplicationOperation:
     """Represents an operation to be replicated."""
@@ -33,6 +65,32 @@ class ReplicationOperation:
         self.retry_count = 0
 
 
+class _OperationQueue:
+    """
+    Replication queue: a SimpleQueue (implemented in C, no Python-level
+    locks or condition variables) with a size limit on put_nowait(). The
+    limit is checked without a lock, so concurrent producers may overshoot
+    it by a few operations.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._queue = SimpleQueue()
+        self.get = self._queue.get
+        self.get_nowait = self._queue.get_nowait
+        self.qsize = self._queue.qsize
+
+    def put_nowait(self, op: ReplicationOperation):
+        """Enqueue op, raising queue.Full if the queue is at its size limit."""
+        if self._queue.qsize() >= self.maxsize:
+            raise Full
+        self._queue.put(op)
+
+    def wake(self):
+        """Wake one blocked consumer; get() returns None for it."""
+        self._queue.put(None)
+
+
 class Replicator:
     """Handles asynchronous replication to replica nodes."""
 
@@ -50,17 +108,30 @@ class Replicator:
         self.replica_manager = replica_manager
         self.mode = mode
         self.max_retries = max_retries
-        self.queue = Queue(maxsize=queue_size)
+        self.queue = _OperationQueue(queue_size)
         self.running = False
         self.worker_threads = []
         self.num_workers = 2  # Number of worker threads
 
+        # Persistent connections to replicas, one per (thread, replica) so a
+        # connection is never shared; all are kept in _connections for stop()
+        self._local = threading.local()
+        self._connections_lock = threading.Lock()
+        self._connections = set()
+
+        # Latest queued put/delete per key, not yet taken by a worker; a newer
+        # op of the same kind for that key updates it instead of being queued
+        self._coalesce = Config.REPLICATION_COALESCE
+        self._coalesce_lock = threading.Lock()
+        self._pending_keys = {}
+
         # Statistics
         self.stats_lock = threading.Lock()
         self.total_operations = 0
         self.successful_replications = 0
         self.failed_replications = 0
         self.dropped_operations = 0
+        self.coalesced_operations = 0
 
     def start(self):
         """Start replication worker threads."""
@@ -77,28 +148,36 @@ class Replicator:
             thread.start()
             self.worker_threads.append(thread)
 
-        print(f"[Replicator] Started {self.num_workers} worker threads in {self.mode} mode")
+        logger.info("[Replicator] Started %d worker threads in %s mode", self.num_workers, self.mode)
 
     def stop(self):
         """Stop replication worker threads."""
         self.running = False
+        for _ in self.worker_threads:
+            self.queue.wake()
         for thread in self.worker_threads:
             thread.join(timeout=2)
         self.worker_threads.clear()
-        print("[Replicator] Stopped")
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            connection.close()
+        logger.info("[Replicator] Stopped")
 
-    def replicate_put(self, key: bytes, value: bytes) -> bool:
+    def replicate_put(self, key: bytes, value: Union[bytes, bytearray, memoryview]) -> bool:
         """
         Replicate a PUT operation.
 
         Args:
             key: The key
-            value: The value
+            value: The value (any bytes-like object)
 
         Returns:
             True if queued/sent successfully, False otherwise
         """
-        op = ReplicationOperation(op='put', key=key, value=value)
+        # Snapshot a mutable buffer before it is queued; bytes() returns a
+        # bytes value itself without copying
+        op = ReplicationOperation(op='put', key=key, value=bytes(value))
         return self._enqueue_operation(op)
 
     def replicate_batch_put(self, keys: List[bytes], values: List[bytes]) -> bool:
@@ -147,30 +226,78 @@ class Replicator:
         else:
             # Asynchronous replication - enqueue
             try:
-                self.queue.put_nowait(op)
+                if self._coalesce:
+                    self._enqueue_coalesced(op)
+                else:
+                    self.queue.put_nowait(op)
                 return True
             except Exception:
                 # Queue is full, drop operation
                 with self.stats_lock:
                     self.dropped_operations += 1
-                print(f"[Replicator] Queue full, dropped operation: {op.op}")
+                logger.warning("[Replicator] Queue full, dropped operation: %s", op.op)
                 return False
 
+    def _enqueue_coalesced(self, op: ReplicationOperation):
+        """
+        Fold op into the queued op of the same kind for its key, or enqueue it.
+        Raises queue.Full if op had to be enqueued and the queue is full.
+        """
+        pending = self._pending_keys
+        with self._coalesce_lock:
+            if op.op == 'batch_put':
+                # Later puts must not fold into an op queued before the batch
+                for key in op.keys:
+                    pending.pop(key, None)
+                self.queue.put_nowait(op)
+                return
+            prev = pending.get(op.key)
+            if prev is not None and prev.op == op.op:
+                prev.value = op.value
+                with self.stats_lock:
+                    self.coalesced_operations += 1
+                return
+            self.queue.put_nowait(op)
+            pending[op.key] = op
+
+    def _claim(self, ops: List[ReplicationOperation]):
+        """Stop ops taken off the queue from absorbing newer ops for their keys."""
+        pending = self._pending_keys
+        with self._coalesce_lock:
+            for op in ops:
+                if op.key is not None and pending.get(op.key) is op:
+                    del pending[op.key]
+
     def _worker_loop(self):
         """Worker thread loop for processing replication queue."""
+        queue = self.queue
+        batch_size = Config.REPLICATION_BATCH_SIZE
         while self.running:
-            try:
-                # Get operation with timeout
-                op = self.queue.get(timeout=1)
+            # Block until there is work; stop() wakes the worker with None
+            op = queue.get()
+            if op is None:
+                continue
 
-                # Replicate to all replicas
-                self._replicate_to_all(op)
+            # Take whatever else is already queued, so it all goes to each
+            # replica in one pipelined write instead of a round trip per op
+            ops = [op]
+            while len(ops) < batch_size:
+                try:
+                    op = queue.get_nowait()
+                except Empty:
+                    break
+                if op is None:
+                    queue.wake()  # Leave stop()'s wake-up for the worker it was meant for
+                    break
+                ops.append(op)
 
-                self.queue.task_done()
-            except Empty:
-                continue
-            except Exception as e:
-                print(f"[Replicator] Worker error: {e}")
+            try:
+                if self._coalesce:
+                    self._claim(ops)
+                # Replicate to all replicas
+                self._replicate_batch(ops)
+            except Exception:
+                logger.exception("[Replicator] Worker error")
 
     def _replicate_to_all(self, op: ReplicationOperation) -> bool:
         """
@@ -182,28 +309,41 @@ class Replicator:
         Returns:
             True if replicated to at least one replica, False otherwise
         """
+        return self._replicate_batch([op])[0]
+
+    def _replicate_batch(self, ops: List[ReplicationOperation]) -> List[bool]:
+        """
+        Replicate operations, in order, to all healthy replicas.
+
+        Args:
+            ops: The replication operations
+
+        Returns:
+            For each operation, whether it was replicated to at least one replica
+        """
         replicas = self.replica_manager.get_healthy_replicas()
 
         if not replicas:
             # No healthy replicas
             with self.stats_lock:
-                self.failed_replications += 1
-            return False
+                self.failed_replications += len(ops)
+            return [False] * len(ops)
 
-        success_count = 0
+        commands, sizes = self._build_commands(ops)
+        success_counts = [0] * len(ops)
         for replica in replicas:
-            if self._replicate_to_replica(op, replica):
-                success_count += 1
+            for i, success in enumerate(self._replicate_to_replica(commands, sizes, replica)):
+                if success:
+                    success_counts[i] += 1
 
         # Consider successful if at least one replica got it
-        if success_count > 0:
-            with self.stats_lock:
-                self.successful_replications += 1
-            return True
-        else:
-            with self.stats_lock:
-                self.failed_replications += 1
+        results = [count > 0 for count in success_counts]
+        failed = [op for op, success in zip(ops, results) if not success]
+        with self.stats_lock:
+            self.successful_replications += len(ops) - len(failed)
+            self.failed_replications += len(failed)
 
+        for op in failed:
             # Retry if under max retries
             if op.retry_count < self.max_retries:
                 op.retry_count += 1
@@ -212,57 +352,108 @@ class Replicator:
                 except Exception:
                     pass  # Queue full, give up
 
-            return False
+        return results
 
-    def _replicate_to_replica(self, op: ReplicationOperation, replica: ReplicaNode) -> bool:
+    def _replicate_to_replica(self, commands: List[bytes], sizes: List[int], replica: ReplicaNode) -> List[bool]:
         """
-        Replicate operation to a specific replica.
+        Send REPLICATE commands to a specific replica, pipelined over one connection.
 
         Args:
-            op: The replication operation
+            commands: The commands, as built by _build_commands
+            sizes: How many operations each command carries
             replica: The target replica node
 
         Returns:
-            True if successful, False otherwise
+            For each operation, True if successful, False otherwise
         """
+        connection = self._get_connection(replica)
         try:
-            # Create socket connection
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(5.0)  # 5 second timeout
-            sock.connect(replica.address)
-
-            # Build replication command based on operation type
-            if op.op == 'put':
-                command = b'REPLICATE PUT ' + op.key + b' ' + op.value + b'\n'
-            elif op.op == 'delete':
-                command = b'REPLICATE DELETE ' + op.key + b'\n'
-            elif op.op == 'batch_put':
-                keys_str = Config.BATCH_SEPARATOR.join(op.keys)
-                values_str = Config.BATCH_SEPARATOR.join(op.values)
-                command = b'REPLICATE BATCHPUT ' + keys_str + b' ' + values_str + b'\n'
-            else:
-                raise ValueError(f"Unknown operation: {op.op}")
+            responses = connection.exchange(commands)
 
-            # Send command
-            sock.sendall(command)
-
-            # Receive response
-            response = sock.recv(Config.CLIENT_RECV_BUFFER)
-            sock.close()
+        except Exception as e:
+            # Drop the connection; the next operation reconnects
+            connection.close()
+            logger.warning("[Replicator] Failed to replicate to %s:%d: %s", replica.host, replica.port, e)
+            self.replica_manager.mark_failure(replica)
+            return [False] * sum(sizes)
 
-            # Check response
+        # Check responses
+        results = []
+        for response, size in zip(responses, sizes):
             if response.startswith(b'OK'):
                 self.replica_manager.mark_success(replica)
-                return True
+                results += [True] * size
             else:
-                print(f"[Replicator] Replica {replica.host}:{replica.port} returned: {response}")
+                logger.warning("[Replicator] Replica %s:%d returned: %r", replica.host, replica.port, response)
                 self.replica_manager.mark_failure(replica)
-                return False
+                results += [False] * size
+        return results
 
-        except Exception as e:
-            print(f"[Replicator] Failed to replicate to {replica.host}:{replica.port}: {e}")
-            self.replica_manager.mark_failure(replica)
-            return False
+    @staticmethod
+    def _build_commands(ops: List[ReplicationOperation]) -> Tuple[List[bytes], List[int]]:
+        """
+        Build the REPLICATE commands for operations, in order.
+
+        A run of consecutive puts is sent as one REPLICATE BATCHPUT, which the
+        replica applies with a single WAL commit and fsync instead of one per
+        put. Puts whose key or value contains the batch separator are sent on
+        their own. Returns the commands and how many operations each carries.
+        """
+        commands = []
+        sizes = []
+        run = []  # Consecutive puts not yet sent
+        for op in ops + [None]:
+            if op is not None and op.op == 'put' and _SEPARATOR not in op.key and _SEPARATOR not in op.value:
+                run.append(op)
+                continue
+            if len(run) > 1:
+                commands.append(Replicator._build_command(ReplicationOperation(
+                    op='batch_put', keys=[put.key for put in run], values=[put.value for put in run])))
+                sizes.append(len(run))
+            elif run:
+                commands.append(Replicator._build_command(run[0]))
+                sizes.append(1)
+            run = []
+            if op is not None:
+                commands.append(Replicator._build_command(op))
+                sizes.append(1)
+        return commands, sizes
+
+    @staticmethod
+    def _build_command(op: ReplicationOperation) -> bytes:
+        """Build the REPLICATE command for an operation."""
+        # Each command is assembled by one join rather than a chain of
+        # concatenations that copies the payload once per step
+        if op.op == 'put':
+            return b''.join((b'REPLICATE PUT ', op.key, b' ', Protocol.escape(op.value)))
+        elif op.op == 'delete':
+            return b'REPLICATE DELETE ' + op.key
+        elif op.op == 'batch_put':
+            # The separator contains no escapable bytes, so escaping the
+            # joined values equals joining them escaped, in one pass
+            return b''.join((b'REPLICATE BATCHPUT ', _SEPARATOR.join(op.keys), b' ',
+                             Protocol.escape(_SEPARATOR.join(op.values))))
+        else:
+            raise ValueError(f"Unknown operation: {op.op}")
+
+    def _get_connection(self, replica: ReplicaNode) -> _Connection:
+        """
+        Get this thread's connection to a replica, creating it on first use.
+
+        The socket itself is opened lazily by the connection and reopened
+        after it has been closed, so one connection object serves all of the
+        thread's operations for that replica.
+        """
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        connection = connections.get(replica.address)
+        if connection is None:
+            connection = _Connection(replica.host, replica.port, _TextCodec, timeout=Config.REPLICATION_TIMEOUT)
+            connections[replica.address] = connection
+            with self._connections_lock:
+                self._connections.add(connection)
+        return connection
 
     def get_stats(self) -> dict:
         """
@@ -278,6 +469,7 @@ class Replicator:
                 'successful_replications': self.successful_replications,
                 'failed_replications': self.failed_replications,
                 'dropped_operations': self.dropped_operations,
+                'coalesced_operations': self.coalesced_operations,
                 'queue_size': self.queue.qsize(),
                 'queue_max_size': self.queue.maxsize,
             }
@@ -8,12 +8,19 @@ class Config:
     HOST = '0.0.0.0'
     PORT = 5555
     SERVER_BACKLOG = 128  # Max queued connections
-    SERVER_TIMEOUT = 1.0  # Socket timeout in seconds for shutdown responsiveness
+    SERVER_WORKER_THREADS = 32  # Threads running commands that may block (writes, range reads)
+    SERVER_MAX_CONNECTIONS = 4096  # Open client connections; further ones are closed on accept (0 = no limit)
+    SERVER_USE_UVLOOP = True  # Run the event loop on uvloop when it is installed
+    SERVER_STOP_TIMEOUT = 5.0  # Seconds stop() waits for in-flight commands before closing the store
 
     # Client settings
     CLIENT_HOST = 'localhost'
     CLIENT_PORT = 5555
-    CLIENT_RECV_BUFFER = 4096  # Socket receive buffer size
+    CLIENT_RECV_BUFFER = 256 * 1024  # Max bytes a client connection reads per recv
+    CLIENT_PIPELINE_WINDOW = 128  # Max commands sent per pipelined write before reading responses
+    CLIENT_PROTOCOL = 'binary'  # 'binary' (length-prefixed frames) or 'text' (legacy newline-delimited commands)
+    CLIENT_POOL_SIZE = 1  # Connections per KVClient; threads beyond this wait for a free one
+    CLIENT_POOL_IDLE_TIMEOUT = 300.0  # Seconds a pooled connection may sit idle before it is reopened (0 = never)
 
     # Storage settings
     DATA_DIR = './kvstore_data'
@@ -21,12 +28,20 @@ class Config:
     DATA_FILENAME = 'data.db'  # Data file filename
     INDEX_FILENAME = 'index.db'  # Index file filename
     CHECKPOINT_INTERVAL = 10  # Seconds between index checkpoints
+    STORE_LOCK = 'rwlock'  # 'rwlock', or 'mutex': a plain Lock, cheaper for write-heavy workloads
+    RWLOCK_SHARDS = 1  # >1 splits the store's reader-writer lock into per-thread reader shards
     MAX_WAL_SIZE = 100 * 1024 * 1024  # 100MB
     WAL_BUFFER_SIZE = 0  # 0 = unbuffered (immediate flush)
+    WAL_PREALLOC_BYTES = 4 * 1024 * 1024  # WAL space reserved on creation; the file is recycled, not shrunk
+    WAL_REPLAY_CHUNK_SIZE = 8 * 1024 * 1024  # Bytes read at a time when replaying the WAL
+    WAL_COMMIT_WINDOW = 0.0  # Seconds a group commit leader waits for more writers to join
+    RANGE_READ_CHUNK_SIZE = 1024  # Records a range scan reads per batch, in file order
 
     # Binary format constants
     LENGTH_FORMAT = '!I'  # Network byte order (big-endian), unsigned int
     LENGTH_SIZE = 4  # Size in bytes for length fields
+    CHECKSUM_FORMAT = '!I'  # CRC32 trailer on data file and WAL records
+    CHECKSUM_SIZE = 4  # Size in bytes for checksum fields
 
     # Compaction settings
     COMPACTION_ENABLED = True  # Enable automatic background compaction
@@ -35,9 +50,10 @@ class Config:
     COMPACTION_MIN_FILE_SIZE = 10 * 1024 * 1024  # Only compact if file >= 10MB
 
     # Network settings
-    CONNECTION_RECV_BUFFER = 4096  # Buffer size for connection handler
     MESSAGE_DELIMITER = b'\n'  # Message delimiter in protocol
     BATCH_SEPARATOR = b'||'  # Separator for batch operations
+    SOCKET_RCVBUF = 0  # SO_RCVBUF for client and server connections (0 = kernel autotuning)
+    SOCKET_SNDBUF = 0  # SO_SNDBUF for client and server connections (0 = kernel autotuning)
 
     # Replication settings
     REPLICATION_ENABLED = False  # Enable/disable replication
@@ -45,6 +61,8 @@ class Config:
     REPLICA_ADDRESSES = []  # List of (host, port) tuples for replica nodes
     REPLICATION_MAX_RETRIES = 3  # Maximum retry attempts per operation
     REPLICATION_QUEUE_SIZE = 10000  # Maximum size of replication queue
+    REPLICATION_BATCH_SIZE = 64  # Max queued operations a worker sends to each replica in one pipelined write
+    REPLICATION_COALESCE = True  # Fold a queued put/delete into a newer one for the same key
     REPLICATION_MAX_FAILURES = 3  # Max consecutive failures before marking unhealthy
     REPLICATION_HEALTH_CHECK_INTERVAL = 30  # Seconds between health checks
     REPLICATION_TIMEOUT = 5.0  # Socket timeout for replication in seconds
@@ -10,8 +10,11 @@ setup(
             'kvstore-client=kvstore.cli.client_cli:main',
         ],
     },
-    python_requires='>=3.7',
+    python_requires='>=3.10',
     extras_require={
+        'uvloop': [
+            'uvloop>=0.17.0',
+        ],
         'test': [
             'pytest>=7.0.0',
             'pytest-timeout>=2.1.0',
@@ -1,7 +1,10 @@
 """Test to demonstrate writer-preferring behavior preventing writer starvation."""
 import threading
 import time
-from kvstore.utils.rwlock import RWLock, ReadLock, WriteLock
+from kvstore.utils.rwlock import RWLock
+
+
+READS_PER_HOLD = 10  # Small reads batched under one read-lock hold
 
 
 def continuous_readers(rwlock, duration, results):
@@ -9,9 +12,10 @@ def continuous_readers(rwlock, duration, results):
     start = time.time()
     count = 0
     while time.time() - start < duration:
-        with ReadLock(rwlock):
-            count += 1
-            time.sleep(0.001)  # Small read operation
+        with rwlock.reader:
+            for _ in range(READS_PER_HOLD):
+                count += 1
+                time.sleep(0.001)  # Small read operation
     results['readers'] = count
 
 
@@ -22,7 +26,7 @@ def writer_attempts(rwlock, results):
     write_times = []
     for i in range(3):
         start = time.time()
-        with WriteLock(rwlock):
+        with rwlock.writer:
             elapsed = time.time() - start
             write_times.append(elapsed)
             print(f"Writer {i+1} acquired lock after {elapsed:.3f}s")
@@ -9,8 +9,10 @@ Tests cover:
 - Error handling
 - Concurrency
 """
+import os
 import time
 import threading
+import pytest
 from kvstore import KVStore
 
 
@@ -38,6 +40,27 @@ class TestBasicOperations:
         assert temp_store.delete(b"key1")
         assert temp_store.read(b"key1") is None
 
+    def test_delete_takes_write_lock_once(self, temp_store, monkeypatch):
+        """Test that delete does a single write-lock acquisition and no read-lock preflight."""
+        temp_store.put(b"key1", b"value1")
+        calls = []
+        rwlock = temp_store.rwlock
+        acquire_read, acquire_write = rwlock.acquire_read, rwlock.acquire_write
+        this_thread = threading.get_ident()
+
+        def record(kind, acquire):
+            # Ignore the background checkpoint thread
+            if threading.get_ident() == this_thread:
+                calls.append(kind)
+            acquire()
+
+        monkeypatch.setattr(rwlock, 'acquire_read', lambda: record('read', acquire_read))
+        monkeypatch.setattr(rwlock, 'acquire_write', lambda: record('write', acquire_write))
+
+        assert temp_store.delete(b"key1")
+        assert not temp_store.delete(b"key1")
+        assert calls == ['write', 'write']
+
     def test_delete_nonexistent_key(self, temp_store):
         """Test deleting a key that doesn't exist."""
         assert not temp_store.delete(b"nonexistent")
@@ -58,6 +81,12 @@ class TestBasicOperations:
         assert temp_store.put(b"large", large_value)
         assert temp_store.read(b"large") == large_value
 
+        # Bytes-like values are stored without converting them to bytes first
+        assert temp_store.put(b"large", bytearray(large_value))
+        assert temp_store.put(b"view", memoryview(large_value)[:1000])
+        assert temp_store.read(b"large") == large_value
+        assert temp_store.read(b"view") == large_value[:1000]
+
     def test_special_characters_in_key(self, temp_store):
         """Test keys with special characters."""
         special_keys = [
@@ -111,6 +140,33 @@ class TestBatchOperations:
         for i in [0, 100, 500, 999]:
             assert temp_store.read(keys[i]) == values[i]
 
+    def test_batch_put_flushes_once(self, temp_store, monkeypatch):
+        """Test that batch put writes all records with a single flush."""
+        flushes = []
+        original_flush = temp_store.data_file.flush_group
+        monkeypatch.setattr(temp_store.data_file, 'flush_group',
+                            lambda *args, **kwargs: flushes.append(1) or original_flush(*args, **kwargs))
+
+        keys = [f"key{i}".encode() for i in range(50)]
+        values = [f"val{i}".encode() for i in range(50)]
+        assert temp_store.batch_put(keys, values)
+
+        assert len(flushes) == 1
+        for key, expected_value in zip(keys, values):
+            assert temp_store.read(key) == expected_value
+
+    def test_batch_put_commits_wal_once(self, temp_store, monkeypatch):
+        """Test that batch put logs all records with a single WAL commit."""
+        commits = []
+        commit = temp_store.wal._commit
+        monkeypatch.setattr(temp_store.wal, '_commit', lambda group: commits.append(group) or commit(group))
+
+        keys = [f"key{i}".encode() for i in range(50)]
+        values = [f"val{i}".encode() for i in range(50)]
+        assert temp_store.batch_put(keys, values)
+
+        assert len(commits) == 1
+
     def test_batch_put_overwrites(self, temp_store):
         """Test that batch put can overwrite existing keys."""
         temp_store.put(b"key1", b"old_value")
@@ -175,6 +231,31 @@ class TestRangeQueries:
         assert b"003" in result
         assert b"007" in result
 
+    def test_read_key_range_sorted_order(self, temp_store):
+        """Test that range results come back in key order regardless of insert order."""
+        for key in [b"d", b"a", b"c", b"e", b"b"]:
+            temp_store.put(key, key.upper())
+        temp_store.delete(b"c")
+
+        result = temp_store.read_key_range(b"a", b"d")
+
+        assert list(result) == [b"a", b"b", b"d"]
+
+    def test_iter_key_range_chunks_in_key_order(self, temp_store, monkeypatch):
+        """Test that chunked range iteration yields key order across chunks."""
+        from kvstore.utils.config import Config
+        monkeypatch.setattr(Config, 'RANGE_READ_CHUNK_SIZE', 3)
+        keys = [b"k%02d" % i for i in range(10)]
+        for key in reversed(keys):
+            temp_store.put(key, key.upper())
+        temp_store.put(b"k04", b"updated")
+
+        items = list(temp_store.iter_key_range(b"k01", b"k08"))
+
+        assert [key for key, _ in items] == keys[1:9]
+        assert dict(items)[b"k04"] == b"updated"
+        assert dict(items)[b"k07"] == b"K07"
+
     def test_read_key_range_excludes_deleted(self, temp_store):
         """Test that range query excludes deleted keys."""
         temp_store.put(b"a", b"val_a")
@@ -321,6 +402,68 @@ class TestConcurrency:
         for i in range(10):
             assert temp_store.read(f"key{i}".encode()) is None
 
+    def test_concurrent_writes_share_wal_commit(self, temp_store, monkeypatch):
+        """Concurrent writers are grouped into fewer WAL commits than puts."""
+        from kvstore.utils.config import Config
+        monkeypatch.setattr(Config, 'WAL_COMMIT_WINDOW', 0.05)
+
+        commits = []
+        commit = temp_store.wal._commit
+        monkeypatch.setattr(temp_store.wal, '_commit', lambda group: (commits.append(len(group)), commit(group)))
+
+        errors = []
+        threads = [
+            threading.Thread(
+                target=self._write_value,
+                args=(temp_store, f"key{i}".encode(), f"value{i}".encode(), errors)
+            )
+            for i in range(10)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(errors) == 0
+        assert sum(commits) == 10
+        assert len(commits) < 10
+        for i in range(10):
+            assert temp_store.read(f"key{i}".encode()) == f"value{i}".encode()
+
+    def test_read_does_not_wait_for_write_lock(self, temp_store):
+        """Point reads proceed while a writer holds the write lock."""
+        from kvstore.utils.rwlock import WriteLock
+        temp_store.put(b"key1", b"value1")
+
+        results = []
+        with WriteLock(temp_store.rwlock):
+            reader = threading.Thread(target=lambda: results.append(temp_store.read(b"key1")))
+            reader.start()
+            reader.join(timeout=5)
+            assert not reader.is_alive()
+
+        assert results == [b"value1"]
+
+    def test_put_places_record_while_reader_holds_lock(self, temp_store):
+        """A writer appends and logs its record without waiting for readers."""
+        from kvstore.utils.rwlock import ReadLock
+        logged = threading.Event()
+        log = temp_store.wal.log
+
+        def log_and_signal(*args):
+            log(*args)
+            logged.set()
+
+        temp_store.wal.log = log_and_signal
+        with ReadLock(temp_store.rwlock):
+            writer = threading.Thread(target=temp_store.put, args=(b"key1", b"value1"))
+            writer.start()
+            # Only the index update waits for the read lock
+            assert logged.wait(timeout=5)
+            assert temp_store.data_file.size > 0
+        writer.join(timeout=5)
+        assert temp_store.read(b"key1") == b"value1"
+
 
 class TestPersistence:
     """Test data persistence and recovery."""
@@ -363,6 +506,51 @@ class TestPersistence:
 
         store2.close()
 
+    def test_batch_put_wal_recovery(self, tmp_path):
+        """Test that a batch logged with a single WAL write is replayed on recovery."""
+        import gc
+
+        store1 = KVStore(str(tmp_path))
+        store1.batch_put([b"key1", b"key2", b"key3"], [b"val1", b"val2", b"val3"])
+        assert len(store1.wal.replay()) == 3
+
+        del store1
+        gc.collect()
+
+        store2 = KVStore(str(tmp_path))
+        assert store2.read(b"key1") == b"val1"
+        assert store2.read(b"key3") == b"val3"
+        store2.close()
+
+    def test_wal_recovery_reuses_logged_records(self, tmp_path):
+        """Test that recovery only re-appends values missing from the data file."""
+        import gc
+
+        store1 = KVStore(str(tmp_path))
+        for i in range(5):
+            store1.put(b"key1", b"value%d" % i)
+        store1.put(b"key2", b"two")
+        store1.put(b"key3", b"gone")
+        store1.delete(b"key3")
+        data_path = store1.data_file.path
+        del store1
+        gc.collect()
+
+        # Tear the last record (key3) and drop key2's record entirely
+        size = os.path.getsize(data_path)
+        key3_record = len(b"key3") + len(b"gone") + 12
+        key2_record = len(b"key2") + len(b"two") + 12
+        with open(data_path, 'r+b') as f:
+            f.truncate(size - key3_record - key2_record + 2)
+
+        store2 = KVStore(str(tmp_path))
+        assert store2.read(b"key1") == b"value4"
+        assert store2.read(b"key2") == b"two"
+        assert store2.read(b"key3") is None
+        # key1 was indexed in place; only key2 was appended again
+        assert store2.data_file.size == size - key3_record + 2
+        store2.close()
+
     def test_batch_put_persistence(self, tmp_path):
         """Test that batch operations persist correctly."""
         store1 = KVStore(str(tmp_path))
@@ -381,6 +569,27 @@ class TestPersistence:
 
         store2.close()
 
+    def test_index_delta_journal_recovery(self, tmp_path):
+        """Test that index changes are rebuilt from the delta journal on load."""
+        store1 = KVStore(str(tmp_path))
+        for i in range(20):
+            store1.put(f"key{i}".encode(), f"value{i}".encode())
+        store1.close()
+
+        # Changes after the first snapshot go to the journal only
+        store2 = KVStore(str(tmp_path))
+        store2.put(b"key3", b"updated")
+        store2.delete(b"key1")
+        store2.index.flush()
+        assert not store2.index.needs_snapshot()
+        store2.close()
+
+        store3 = KVStore(str(tmp_path))
+        assert store3.read(b"key1") is None
+        assert store3.read(b"key2") == b"value2"
+        assert store3.read(b"key3") == b"updated"
+        store3.close()
+
     def test_delete_persistence(self, tmp_path):
         """Test that deletes persist correctly."""
         store1 = KVStore(str(tmp_path))
@@ -468,3 +677,458 @@ class TestEdgeCases:
         assert result[b"key05"] == b"updated"
         assert b"key03" not in result
         assert b"key07" not in result
+
+
+def test_datafile_read_many_matches_read(tmp_path):
+    """read_many returns the same records as individual read calls"""
+    from kvstore.core.datafile import DataFile
+
+    data_file = DataFile(str(tmp_path / 'data.db'))
+    offsets = [offset for offset, _ in data_file.append_batch([(b'k%d' % i, b'v' * i) for i in range(10)])]
+
+    records = data_file.read_many(offsets)
+    assert [(bytes(k), bytes(v)) for k, v in records] == \
+        [tuple(map(bytes, data_file.read(offset))) for offset in offsets]
+    records = None
+    data_file.close()
+
+
+def test_datafile_detects_corrupt_record(tmp_path):
+    """A flipped byte in a stored record raises CorruptionError on read"""
+    from kvstore.core.datafile import DataFile, CorruptionError
+
+    path = str(tmp_path / 'data.db')
+    data_file = DataFile(path)
+    offset, length = data_file.append(b'key', b'value')
+    data_file.close()
+
+    with open(path, 'r+b') as f:
+        f.seek(offset + length - 6)  # Inside the value
+        f.write(b'X')
+
+    data_file = DataFile(path)
+    try:
+        with pytest.raises(CorruptionError):
+            data_file.read(offset)
+    finally:
+        data_file.close()
+
+
+def test_store_upgrades_legacy_data_file(tmp_path):
+    """A data file from before record checksums is converted, with its index, on open"""
+    import pickle
+    import struct
+    from kvstore.core.datafile import DataFile
+
+    # Baseline layout: [key_len][key][value_len][value] records, tuple index
+    records = [(b'a', b'old'), (b'b', b'2'), (b'a', b'1'), (b'gone', b'x')]
+    index = {}
+    with open(tmp_path / 'data.db', 'wb') as f:
+        for key, value in records:
+            record = struct.pack('!I', len(key)) + key + struct.pack('!I', len(value)) + value
+            index[key] = (f.tell(), len(record))
+            f.write(record)
+        f.write(struct.pack('!I', 5) + b'to')  # Torn tail
+    del index[b'gone']
+    with open(tmp_path / 'index.db', 'wb') as f:
+        pickle.dump(index, f)
+
+    with pytest.raises(ValueError, match='convert_legacy'):
+        DataFile(str(tmp_path / 'data.db'))
+
+    store = KVStore(str(tmp_path))
+    assert store.read(b'a') == b'1'
+    assert store.read(b'b') == b'2'
+    assert store.read(b'gone') is None
+    store.put(b'c', b'3')
+    store.close()
+
+    assert not DataFile.is_legacy(str(tmp_path / 'data.db'))
+    store = KVStore(str(tmp_path))
+    assert store.read_key_range(b'a', b'z') == {b'a': b'1', b'b': b'2', b'c': b'3'}
+    store.close()
+
+
+def test_wal_replay_stops_at_torn_tail(tmp_path):
+    """Replay keeps intact records and drops a truncated last record"""
+    from kvstore.core.wal import WAL
+
+    path = str(tmp_path / 'wal.log')
+    wal = WAL(path)
+    wal.log('put', b'a', b'1')
+    wal.log('put', b'b', b'2')
+    end = wal.file.tell()
+    wal.close()
+
+    with open(path, 'r+b') as f:
+        f.truncate(end - 3)
+
+    wal = WAL(path)
+    entries = wal.replay()
+    wal.close()
+    assert [entry['key'] for entry in entries] == [b'a']
+
+
+def test_wal_replay_round_trip(tmp_path):
+    """Logged puts and deletes replay with their keys, values and order"""
+    from kvstore.core.wal import WAL
+
+    wal = WAL(str(tmp_path / 'wal.log'))
+    wal.log('put', b'a', b'1')
+    wal.log_batch([('put', b'b', b''), ('delete', b'a', None)])
+    entries = wal.replay()
+    wal.close()
+
+    assert [(e['op'], e['key'], e['value']) for e in entries] == \
+        [('put', b'a', b'1'), ('put', b'b', b''), ('delete', b'a', None)]
+
+
+def test_sharded_rwlock_excludes_readers_during_write():
+    """A writer on a ShardedRWLock blocks readers on every shard until it releases"""
+    from kvstore.utils.rwlock import ShardedRWLock, ReadLock, WriteLock
+
+    rwlock = ShardedRWLock(4)
+    entered = []
+
+    def reader():
+        with ReadLock(rwlock):
+            entered.append(1)
+
+    with WriteLock(rwlock):
+        readers = [threading.Thread(target=reader) for _ in range(8)]
+        for t in readers:
+            t.start()
+        time.sleep(0.05)
+        assert entered == []
+    for t in readers:
+        t.join(timeout=5)
+    assert len(entered) == 8
+
+
+def test_rwlock_try_acquire():
+    """try_acquire_read/try_acquire_write succeed only when they would not block"""
+    from kvstore.utils.rwlock import RWLock, ShardedRWLock
+
+    for rwlock in (RWLock(), ShardedRWLock(4)):
+        assert rwlock.try_acquire_read()
+        assert not rwlock.try_acquire_write()
+        rwlock.release_read()
+
+        assert rwlock.try_acquire_write()
+        assert not rwlock.try_acquire_read()
+        assert not rwlock.try_acquire_write()
+        rwlock.release_write()
+
+        assert rwlock.try_acquire_read()
+        rwlock.release_read()
+
+        # The shared context managers
+        with rwlock.writer:
+            assert not rwlock.try_acquire_read()
+        with rwlock.reader:
+            assert not rwlock.try_acquire_write()
+        assert rwlock.try_acquire_write()
+        rwlock.release_write()
+
+
+def test_rwlock_preference():
+    """A waiting writer blocks new readers only on a writer-preferring RWLock"""
+    from kvstore.utils.rwlock import RWLock
+
+    for prefer, reader_admitted in (('writer', False), ('reader', True)):
+        rwlock = RWLock(prefer)
+        rwlock.acquire_read()
+        writer = threading.Thread(target=lambda: (rwlock.acquire_write(), rwlock.release_write()))
+        writer.start()
+        time.sleep(0.05)  # Writer is now waiting for the reader
+
+        assert rwlock.try_acquire_read() is reader_admitted
+        if reader_admitted:
+            rwlock.release_read()
+        rwlock.release_read()
+        writer.join(timeout=5)
+        assert not writer.is_alive()
+
+
+def test_store_with_mutex_lock(tmp_path, monkeypatch):
+    """STORE_LOCK='mutex' runs the store on a plain Lock behind the RWLock interface"""
+    from kvstore.utils.config import Config
+    from kvstore.utils.rwlock import MutexLock
+
+    monkeypatch.setattr(Config, 'STORE_LOCK', 'mutex')
+    store = KVStore(str(tmp_path))
+    try:
+        assert isinstance(store.rwlock, MutexLock)
+        assert store.put(b"a", b"1")
+        assert store.batch_put([b"b", b"c"], [b"2", b"3"])
+        assert store.delete(b"c")
+        assert store.read_key_range(b"a", b"z") == {b"a": b"1", b"b": b"2"}
+        assert store.rwlock.try_acquire_write()
+        assert not store.rwlock.try_acquire_read()
+        store.rwlock.release_write()
+    finally:
+        store.close()
+
+
+def test_datafile_reads_unmapped_tail(tmp_path):
+    """Records written after the file was mapped read back correctly, small or large"""
+    from kvstore.core.datafile import DataFile
+
+    data_file = DataFile(str(tmp_path / 'data.db'))
+    [(first, _)] = data_file.append_batch([(b'first', b'1')])
+    assert bytes(data_file.read(first)[1]) == b'1'  # Maps the file
+
+    small = data_file.append(b'small', b'x' * 10)
+    large = data_file.append(b'large', b'y' * 10000)
+    data_file.flush_group()
+    for _ in range(100):
+        assert bytes(data_file.read(small[0])[1]) == b'x' * 10
+        assert bytes(data_file.read(large[0])[1]) == b'y' * 10000
+    data_file.close()
+
+
+def test_wal_recycled_file_ignores_old_generation(tmp_path):
+    """After truncate, replay returns only records of the new generation"""
+    from kvstore.core.wal import WAL
+
+    path = str(tmp_path / 'wal.log')
+    wal = WAL(path)
+    wal.log_batch([('put', b'old%d' % i, b'x' * 100) for i in range(10)])
+    size = os.path.getsize(path)
+    wal.truncate()
+    wal.log('put', b'new', b'1')
+    wal.close()
+
+    assert os.path.getsize(path) == size  # Recycled in place
+    wal = WAL(path)
+    assert [entry['key'] for entry in wal.replay()] == [b'new']
+    wal.log('put', b'next', b'2')  # Appends after the last valid record
+    assert [entry['key'] for entry in wal.replay()] == [b'new', b'next']
+    wal.close()
+
+
+def test_wal_reopens_over_large_stale_record(tmp_path):
+    """Garbage lengths read from an older generation's large record end the log"""
+    from kvstore.core.wal import WAL
+
+    path = str(tmp_path / 'wal.log')
+    wal = WAL(path)
+    wal.log('put', b'k', b'\xff' * 100000)
+    wal.truncate()
+    wal.log('put', b'a', b'b')
+    wal.close()
+
+    wal = WAL(path)
+    assert list(wal.iter_raw()) == [('put', b'a', b'b')]
+    wal.close()
+
+    store = KVStore(str(tmp_path / 'store'))
+    store.put(b'big', b'\xff' * 200000)
+    store.wal.truncate()  # As a checkpoint does
+    store.put(b'a', b'b')
+    store.close()
+    store = KVStore(str(tmp_path / 'store'))
+    assert store.read(b'a') == b'b'
+    assert store.read(b'big') == b'\xff' * 200000
+    store.close()
+
+
+def test_wal_replay_across_chunk_boundaries(tmp_path, monkeypatch):
+    """Records split across replay read chunks are reassembled"""
+    from kvstore.core.wal import WAL
+    from kvstore.utils.config import Config
+
+    wal = WAL(str(tmp_path / 'wal.log'))
+    ops = [('put', b'key%d' % i, b'v' * i) for i in range(50)] + [('delete', b'key3', None)]
+    wal.log_batch(ops)
+    monkeypatch.setattr(Config, 'WAL_REPLAY_CHUNK_SIZE', 7)
+    assert list(wal.iter_raw()) == [(op, key, value) for op, key, value in ops]
+    wal.close()
+
+
+def test_wal_reads_legacy_format(tmp_path):
+    """Logs written before records carried data-file offsets still replay"""
+    import struct
+    from kvstore.core.wal import WAL
+
+    path = str(tmp_path / 'wal.log')
+    with open(path, 'wb') as f:
+        f.write(struct.pack('!cI', b'\x02', 7))
+        f.write(WAL._encode(b'\x02', 7, 0, 'put', b'old', b'value'))
+
+    wal = WAL(path)
+    wal.log('put', b'new', b'value', 42)
+    assert list(wal.iter_placed()) == [('put', b'old', b'value', None), ('put', b'new', b'value', None)]
+
+    wal.truncate()
+    wal.log('put', b'next', b'value', 42)
+    assert list(wal.iter_placed()) == [('put', b'next', b'value', 42)]
+    wal.close()
+
+
+def test_store_recovers_pickle_wal(tmp_path):
+    """A WAL in the original pickle format is upgraded and replayed on open"""
+    import pickle
+    import struct
+    from kvstore.core.wal import WAL
+
+    path = str(tmp_path / 'wal.log')
+    with open(path, 'wb') as f:
+        for op, key, value in [('put', b'a', b'1'), ('put', b'b', b'2'), ('delete', b'a', None)]:
+            entry = pickle.dumps({'op': op, 'key': key, 'value': value, 'timestamp': time.time()})
+            f.write(struct.pack('!I', len(entry)) + entry)
+        f.write(struct.pack('!I', 100) + b'\x80\x04torn')
+
+    store = KVStore(str(tmp_path))
+    assert store.read(b'a') is None
+    assert store.read(b'b') == b'2'
+    store.put(b'c', b'3')
+    store.close()
+
+    wal = WAL(path)
+    assert list(wal.iter_raw()) == [('put', b'c', b'3')]
+    wal.close()
+    store = KVStore(str(tmp_path))
+    assert store.read(b'b') == b'2'
+    assert store.read(b'c') == b'3'
+    store.close()
+
+
+def test_index_loads_unpacked_snapshot(tmp_path):
+    """Snapshots holding (offset, length) tuples load into the packed index"""
+    import pickle
+    from kvstore.core.index import Index
+
+    path = str(tmp_path / 'index.db')
+    with open(path, 'wb') as f:
+        pickle.dump({b'a': (0, 20), b'b': (20, 1 << 33)}, f)
+
+    index = Index(path)
+    assert index.get(b'a') == (0, 20)
+    assert index.get(b'b') == (20, 1 << 33)
+    assert index.get_range(b'a', b'z') == {b'a': (0, 20), b'b': (20, 1 << 33)}
+    index.close()
+
+
+def test_index_sorted_keys_across_buckets(monkeypatch):
+    """Range lookups stay correct as keys are added and removed across bucket splits"""
+    import random
+    from kvstore.core import index as index_module
+
+    monkeypatch.setattr(index_module, '_BUCKET_SIZE', 4)
+    rng = random.Random(7)
+    keys = index_module._SortedKeys()
+    reference = set()
+    for _ in range(2000):
+        key = b'%03d' % rng.randrange(300)
+        if key in reference:
+            keys.remove(key)
+            reference.discard(key)
+        else:
+            keys.add(key)
+            reference.add(key)
+        lo, hi = sorted((b'%03d' % rng.randrange(300), b'%03d' % rng.randrange(300)))
+        assert keys.irange(lo, hi) == sorted(k for k in reference if lo <= k <= hi)
+    assert keys.irange(b'', b'~') == sorted(reference)
+
+
+def test_index_ignores_journal_of_replaced_snapshot(tmp_path):
+    """A journal left behind by a crash right after a new snapshot is not applied to it"""
+    import pickle
+    import shutil
+    import struct
+    from kvstore.core.index import Index
+
+    path = str(tmp_path / 'index.db')
+    index = Index(path)
+    index.put_journaled(b'a', 0, 10)
+    index.save(force=True)
+    index.put_journaled(b'b', 10, 10)  # Offset in the data file before compaction
+    index.flush()
+    shutil.copy(path + '.delta', str(tmp_path / 'stale'))
+
+    index.replace({b'a': (0, 10), b'b': (50, 10)})  # As after compaction
+    index.save(force=True)
+    index.close()
+    shutil.copy(str(tmp_path / 'stale'), path + '.delta')  # Crash before truncation
+
+    index = Index(path)
+    assert index.get(b'b') == (50, 10)
+    index.put_journaled(b'c', 60, 10)
+    index.close()
+    index = Index(path)
+    assert index.get_range(b'a', b'z') == {b'a': (0, 10), b'b': (50, 10), b'c': (60, 10)}
+    index.close()
+
+    # A journal from before generations still applies to its unstamped base
+    with open(path, 'wb') as f:
+        pickle.dump({b'a': (0, 10)}, f)
+    with open(path + '.delta', 'wb') as f:
+        f.write(struct.pack('!BIQI', 0, 1, 10, 10) + b'b')
+    index = Index(path)
+    assert index.get_range(b'a', b'z') == {b'a': (0, 10), b'b': (10, 10)}
+    index.close()
+
+
+def test_index_tracks_live_bytes(tmp_path):
+    """live_bytes follows puts, overwrites and deletes, and survives a reload"""
+    from kvstore.core.index import Index
+
+    path = str(tmp_path / 'index.db')
+    index = Index(path)
+    index.put_journaled(b'a', 0, 10)
+    index.put_journaled(b'b', 10, 20)
+    index.put_journaled(b'a', 30, 15)
+    index.delete_journaled(b'b')
+    index.delete_journaled(b'missing')
+    assert index.live_bytes == 15
+    index.flush()
+    index.close()
+
+    assert Index(path).live_bytes == 15
+
+
+def test_data_directory_lock_excludes_other_processes(tmp_path):
+    """Another process cannot open a directory in use, but can once it is closed"""
+    import subprocess
+    import sys
+
+    script = (
+        "import sys\n"
+        "from kvstore.core.store import KVStore, DataDirectoryLockError\n"
+        "try:\n"
+        "    KVStore(sys.argv[1]).close()\n"
+        "except DataDirectoryLockError:\n"
+        "    sys.exit(3)\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    store = KVStore(str(tmp_path))
+    locked = subprocess.run([sys.executable, '-c', script, str(tmp_path)], env=env)
+    store.close()
+    unlocked = subprocess.run([sys.executable, '-c', script, str(tmp_path)], env=env)
+
+    assert locked.returncode == 3
+    assert unlocked.returncode == 0
+
+
+def test_wal_writev_resumes_after_short_write(tmp_path, monkeypatch):
+    """Groups of large records are written with writev, even when it writes short"""
+    from kvstore.core.wal import WAL
+
+    writev = os.writev
+    calls = []
+
+    def short_writev(fd, buffers):
+        # Write at most 5000 bytes per call
+        data = b''.join(bytes(b) for b in buffers)[:5000]
+        calls.append(len(data))
+        return writev(fd, [data])
+
+    monkeypatch.setattr(os, 'writev', short_writev)
+    wal = WAL(str(tmp_path / 'wal.log'))
+    ops = [('put', b'key%d' % i, bytes([i]) * 20000) for i in range(3)]
+    wal.log_batch(ops)
+    assert len(calls) > 1
+    assert list(wal.iter_raw()) == ops
+    wal.close()
@@ -4,6 +4,7 @@ import time
 import shutil
 from pathlib import Path
 from kvstore.core.store import KVStore
+from kvstore.core.index import unpack_location
 from kvstore.utils.config import Config
 
 
@@ -143,6 +144,25 @@ class TestCompaction:
             key = f'key_{i:03d}'.encode()
             assert temp_store.read(key) is None, f"Deleted key {key} still readable"
 
+    def test_compact_without_copy_file_range(self, temp_store, monkeypatch):
+        """Test that compaction falls back to pread/pwrite when in-kernel copy fails."""
+        import os
+
+        def unsupported(*args):
+            raise OSError(18, 'Invalid cross-device link')
+
+        monkeypatch.setattr(os, 'copy_file_range', unsupported, raising=False)
+        for i in range(100):
+            temp_store.put(f'key_{i:03d}'.encode(), f'value_{i:03d}'.encode())
+        for i in range(0, 100, 3):
+            temp_store.delete(f'key_{i:03d}'.encode())
+
+        temp_store._compact()
+
+        for i in range(100):
+            expected = None if i % 3 == 0 else f'value_{i:03d}'.encode()
+            assert temp_store.read(f'key_{i:03d}'.encode()) == expected
+
     def test_compact_with_overwrites(self, temp_store):
         """Test compaction with overwritten values."""
         # Insert, overwrite, then delete some keys
@@ -242,6 +262,22 @@ class TestCompaction:
         # No read errors should occur
         assert len(read_errors) == 0, f"Read errors: {read_errors[:5]}"
 
+    def test_reader_holding_old_view_survives_compaction(self, temp_store, monkeypatch):
+        """A lock-free reader that took the read view before a swap can still read the old file."""
+        temp_store.put(b'first', b'1')
+        temp_store.read(b'first')  # Maps the data file
+        temp_store.put(b'tail', b'2')  # Past the mapping: read with pread
+        temp_store.delete(b'first')
+
+        index, data_file = temp_store._read_view
+        # Keep the mapping the reader loaded before the swap
+        monkeypatch.setattr(data_file, '_update_mmap', lambda: None)
+        temp_store._compact()
+        assert temp_store._read_view[1] is not data_file
+
+        offset, _ = unpack_location(index.get(b'tail'))
+        assert bytes(data_file.read(offset)[1]) == b'2'
+
     def test_compact_concurrent_writes(self, temp_store):
         """Test that writes work during compaction."""
         import threading
@@ -55,6 +55,179 @@ class TestClientServerBasic:
         finally:
             server.stop()
 
+    def test_client_pipeline(self, tmp_path):
+        """Test that pipelined commands return results in order."""
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            with KVClient(host="localhost", port=actual_port) as client:
+                with client.pipeline() as pipe:
+                    for i in range(300):
+                        pipe.put(f"key{i}", f"value\n{i}")
+                    pipe.read("key7")
+                    pipe.read("missing")
+                    pipe.delete("key8")
+                    pipe.read_key_range("key1", "key10")
+
+                assert pipe.results[:300] == [True] * 300
+                assert pipe.results[300:303] == ["value\n7", None, True]
+                assert pipe.results[303] == {"key1": "value\n1", "key10": "value\n10"}
+                assert client.read("key8") is None
+
+        finally:
+            server.stop()
+
+    def test_client_batch_read_and_delete(self, tmp_path):
+        """Test pipelined batch_read and batch_delete."""
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            with KVClient(host="localhost", port=actual_port) as client:
+                keys = [f"key{i}" for i in range(300)]
+                assert client.batch_put(keys, [f"value{i}" for i in range(300)])
+
+                assert client.batch_read(["key2", "missing", "key299"]) == ["value2", None, "value299"]
+                assert client.batch_read(keys) == [f"value{i}" for i in range(300)]
+
+                assert client.batch_delete(keys[:200]) == [True] * 200
+                assert client.batch_read(["key0", "key200"]) == [None, "value200"]
+
+        finally:
+            server.stop()
+
+    def test_client_reuses_connection(self, tmp_path):
+        """Test that a client sends consecutive commands over one connection."""
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            with KVClient(host="localhost", port=actual_port) as client:
+                assert client.put("key1", "value1")
+                sock = client._pool._connections[0].sock
+                assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+                assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+                server_sock = next(iter(server._handlers)).transport.get_extra_info("socket")
+                assert server_sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+                assert server_sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+                assert client.read("key1") == "value1"
+                assert client.delete("key1")
+                assert client._pool._connections[0].sock is sock
+
+            assert client._pool._connections[0].sock is None
+
+        finally:
+            server.stop()
+
+    def test_client_applies_socket_buffer_config(self, tmp_path, monkeypatch):
+        """Test that configured socket buffer sizes are applied to client connections."""
+        from kvstore.utils.config import Config
+
+        monkeypatch.setattr(Config, "SOCKET_RCVBUF", 256 * 1024)
+        monkeypatch.setattr(Config, "SOCKET_SNDBUF", 256 * 1024)
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            with KVClient(host="localhost", port=actual_port) as client:
+                assert client.put("key1", "value1")
+                sock = client._pool._connections[0].sock
+                assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 128 * 1024
+                assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 128 * 1024
+
+        finally:
+            server.stop()
+
+    def test_client_pool_serves_concurrent_threads(self, tmp_path):
+        """Test that a pooled client runs commands from several threads at once."""
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            with KVClient(host="localhost", port=actual_port, pool_size=4) as client:
+                barrier = threading.Barrier(4)
+                errors = []
+
+                def worker(n):
+                    try:
+                        barrier.wait()
+                        for i in range(50):
+                            assert client.put(f"t{n}_{i}", f"v{i}")
+                            assert client.read(f"t{n}_{i}") == f"v{i}"
+                    except Exception as e:
+                        errors.append(e)
+
+                threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+
+                assert not errors
+                assert client._pool._idle.qsize() == 4
+                assert sum(c.sock is not None for c in client._pool._connections) > 1
+
+        finally:
+            server.stop()
+
+    def test_shared_pool_reuses_connections_across_clients(self, tmp_path, monkeypatch):
+        """Clients sharing a KVConnectionPool reuse its connection and leave it open on close."""
+        from kvstore.network.client import KVConnectionPool
+        from kvstore.utils.config import Config
+
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+
+        try:
+            time.sleep(0.5)
+            with KVConnectionPool("localhost", server.port, max_size=2) as pool:
+                with KVClient(pool=pool) as client:
+                    assert client.put("shared", "value")
+                    sock = pool._connections[0].sock
+                assert sock is not None and sock.fileno() != -1
+
+                with KVClient(pool=pool) as client:
+                    assert client.read("shared") == "value"
+                    assert pool._connections[0].sock is sock
+
+                # A connection idle past the timeout is reopened on next use
+                monkeypatch.setattr(Config, "CLIENT_POOL_IDLE_TIMEOUT", 0.01)
+                time.sleep(0.05)
+                assert KVClient(pool=pool).read("shared") == "value"
+                assert pool._connections[0].sock is not sock
+            assert pool._connections[0].sock is None
+
+        finally:
+            server.stop()
+
     def test_client_delete(self, tmp_path):
         """Test client DELETE operation."""
         server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
@@ -206,6 +379,66 @@ class TestMultipleClients:
         finally:
             server.stop()
 
+    def test_many_idle_connections_do_not_take_threads(self, tmp_path):
+        """Test that open connections are served without a thread each."""
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+        idle = []
+
+        try:
+            baseline = threading.active_count()
+            for _ in range(200):
+                idle.append(socket.create_connection(("localhost", actual_port)))
+
+            with KVClient(host="localhost", port=actual_port) as client:
+                assert client.put("key", "value")
+                assert client.read("key") == "value"
+
+            assert threading.active_count() < baseline + 50
+
+        finally:
+            for sock in idle:
+                sock.close()
+            server.stop()
+
+    def test_connections_beyond_limit_are_closed(self, tmp_path, monkeypatch):
+        """Test that connections over SERVER_MAX_CONNECTIONS are closed and slots are freed on close."""
+        from kvstore.utils.config import Config
+
+        monkeypatch.setattr(Config, "SERVER_MAX_CONNECTIONS", 2)
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            first = socket.create_connection(("localhost", actual_port))
+            second = socket.create_connection(("localhost", actual_port))
+            second.sendall(b"PUT k v\n")
+            assert second.recv(1024) == b"OK\n"
+
+            rejected = socket.create_connection(("localhost", actual_port))
+            rejected.settimeout(2)
+            assert rejected.recv(1024) == b""
+            rejected.close()
+
+            first.close()
+            time.sleep(0.1)
+            with KVClient(host="localhost", port=actual_port) as client:
+                assert client.read("k") == "v"
+            second.close()
+
+        finally:
+            server.stop()
+
     def test_multiple_clients_concurrent_writes(self, tmp_path):
         """Test multiple clients writing concurrently."""
         server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
@@ -327,6 +560,104 @@ class TestProtocol:
         finally:
             server.stop()
 
+    def test_escape_round_trip(self):
+        """Test that escape/unescape round-trip awkward byte sequences."""
+        from kvstore.network.protocol import Protocol
+
+        samples = [b"", b"plain", b"a\nb\r\tc", b"\\", b"\\n", b"\\\n", b"\x00\\\x00",
+                   b"tail\\", b"row\t1\n" * 100, b"x" * 10000 + b"\n" + b"\\" * 3]
+        for data in samples:
+            escaped = Protocol.escape(data)
+            assert b"\n" not in escaped
+            assert Protocol.unescape(escaped) == data
+
+        plain = b"no special bytes here"
+        assert Protocol.escape(plain) is plain
+        assert Protocol.unescape(plain) is plain
+
+    def test_parse_command_dispatch(self):
+        """Test command parsing for exact, lower-case and unknown command names."""
+        import pytest
+        from kvstore.network.protocol import Protocol
+
+        assert Protocol.parse_command(b"PUT k a\\nb") == ("PUT", b"k", b"a\nb")
+        assert Protocol.parse_command(b"read k") == ("READ", b"k", None)
+        assert Protocol.parse_command(b"REPLICATE DELETE k") == ("REPLICATE_DELETE", b"k", None)
+        with pytest.raises(ValueError, match="Unknown command: FETCH"):
+            Protocol.parse_command(b"fetch k")
+
+    def test_client_text_protocol(self, tmp_path):
+        """Test that a client can still use the legacy text protocol."""
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            with KVClient(host="localhost", port=actual_port, protocol="text") as client:
+                assert client.put("key1", "line1\nline2\\")
+                assert client.batch_put(["key2", "key3"], ["a\tb", "c"])
+                assert client.read("key1") == "line1\nline2\\"
+                assert client.read_key_range("key1", "key3") == {
+                    "key1": "line1\nline2\\", "key2": "a\tb", "key3": "c"}
+                assert client.delete("key2")
+                assert client.read("key2") is None
+
+        finally:
+            server.stop()
+
+    def test_binary_protocol_frames(self, tmp_path):
+        """Test raw binary-protocol frames: values are sent unescaped."""
+        import struct
+        import pytest
+        from kvstore.network.client import KVClientError
+        from kvstore.network.protocol import (Protocol, BINARY_MAGIC, OP_PUT, OP_READ,
+                                              STATUS_OK, STATUS_NOT_FOUND, STATUS_ERROR)
+
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        received = bytearray()
+
+        def read_frame(sock):
+            while len(received) < 4 or len(received) < 4 + struct.unpack("!I", received[:4])[0]:
+                received.extend(sock.recv(4096))
+            end = 4 + struct.unpack("!I", received[:4])[0]
+            frame = bytes(received[4:end])
+            del received[:end]
+            return frame
+
+        try:
+            with socket.create_connection(("localhost", actual_port)) as sock:
+                value = b"raw\nvalue\\n||"
+                sock.sendall(BINARY_MAGIC + Protocol.encode_frame(OP_PUT, [b"k", value])
+                             + Protocol.encode_frame(OP_READ, [b"k"]))
+                assert read_frame(sock) == bytes([STATUS_OK])
+                response = read_frame(sock)
+                assert response[0] == STATUS_OK
+                assert Protocol.decode_fields(response) == [value]
+
+                sock.sendall(Protocol.encode_frame(OP_READ, [b"missing"]) + Protocol.encode_frame(99))
+                assert read_frame(sock) == bytes([STATUS_NOT_FOUND])
+                assert read_frame(sock)[0] == STATUS_ERROR
+
+            with KVClient(host="localhost", port=actual_port) as client:
+                assert client.read("k") == value.decode()
+                with pytest.raises(KVClientError, match="READ requires key"):
+                    client._codec.parse_read(
+                        server._process_frame(Protocol.encode_frame(OP_READ)[4:])[4:])
+
+        finally:
+            server.stop()
+
     def test_empty_value(self, tmp_path):
         """Test storing and retrieving empty values."""
         server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
@@ -424,6 +755,198 @@ class TestServerRobustness:
         finally:
             server.stop()
 
+    def test_pipelined_messages_survive_paused_writing(self):
+        """Test messages left queued when writing pauses mid-batch are each answered once resumed."""
+        from kvstore.network.connection import ConnectionHandler
+
+        class PausingTransport:
+            """Pauses the handler's writing from inside its first write, as asyncio may."""
+
+            def __init__(self):
+                self.handler = None
+                self.writes = 0
+
+            def writelines(self, chunks):
+                self.writes += 1
+                if self.writes == 1:
+                    self.handler.pause_writing()
+
+            def pause_reading(self):
+                pass
+
+            def resume_reading(self):
+                pass
+
+            def is_closing(self):
+                return False
+
+        processed = []
+
+        def process_message(message):
+            processed.append(message)
+            return b"x" * (64 * 1024)  # Large enough to flush after every response
+
+        handler = ConnectionHandler(process_message, None, None)
+        handler.transport = PausingTransport()
+        handler.transport.handler = handler
+
+        handler.data_received(b"READ a\nREAD b\nREAD c\nREAD d\n")
+        assert processed == [b"READ a"]
+        handler.resume_writing()
+        handler.data_received(b"READ e\n")
+
+        assert processed == [b"READ a", b"READ b", b"READ c", b"READ d", b"READ e"]
+
+    def test_worker_pool_failure_on_binary_connection(self):
+        """Test a failed worker-pool command answers with an error frame, and reading stays paused until then."""
+        from concurrent.futures import Future
+        from kvstore.network.connection import ConnectionHandler
+        from kvstore.network.protocol import BINARY_MAGIC, OP_PUT, STATUS_ERROR, Protocol
+
+        class RecordingTransport:
+            def __init__(self):
+                self.written = b""
+                self.reading = True
+
+            def writelines(self, chunks):
+                self.written += b"".join(chunks)
+
+            def pause_reading(self):
+                self.reading = False
+
+            def resume_reading(self):
+                self.reading = True
+
+            def is_closing(self):
+                return False
+
+        class PendingExecutor:
+            def submit(self, fn, *args):
+                self.future = Future()
+                return self.future
+
+        class ImmediateLoop:
+            def call_soon_threadsafe(self, callback, *args):
+                callback(*args)
+
+        executor = PendingExecutor()
+        handler = ConnectionHandler(None, None, executor)
+        handler.transport = RecordingTransport()
+        handler._loop = ImmediateLoop()
+
+        frame = Protocol.encode_frame(OP_PUT, [b"key", b"value"])
+        handler.data_received(BINARY_MAGIC + frame)
+        assert not handler.transport.reading
+
+        handler.pause_writing()
+        handler.resume_writing()
+        assert not handler.transport.reading  # The PUT is still running
+
+        executor.future.set_exception(RuntimeError("boom"))
+        assert handler.transport.written == Protocol.encode_frame(STATUS_ERROR, [b"Internal error: boom"])
+        assert handler.transport.reading
+
+    def test_pipelined_large_reads_to_slow_reader(self, tmp_path, monkeypatch):
+        """Test large pipelined READs stay one response per command, in order, under backpressure."""
+        from kvstore.utils.config import Config
+
+        # A small server send buffer makes writes back up (and pause) quickly
+        monkeypatch.setattr(Config, "SOCKET_SNDBUF", 16 * 1024)
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            values = {f"key{i}": str(i) * 200000 for i in range(8)}
+            with KVClient(host="localhost", port=actual_port) as client:
+                assert client.batch_put(list(values), list(values.values()))
+
+            commands = [f"READ {key}" for key in values]
+            commands[4:4] = ["PUT extra 1", "READ missing"]
+            expected = [values[key].encode() for key in values]
+            expected[4:4] = [b"OK", b"NOT_FOUND"]
+
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            sock.settimeout(10)  # A lost or merged command leaves a response missing
+            sock.connect(("localhost", actual_port))
+            try:
+                sock.sendall(("\n".join(commands) + "\n").encode())
+                received = bytearray()
+                while received.count(b"\n") < len(commands):
+                    time.sleep(0.001)  # Read slowly so the server's writes back up
+                    chunk = sock.recv(16384)
+                    assert chunk
+                    received += chunk
+            finally:
+                sock.close()
+
+            assert received.split(b"\n")[:-1] == expected
+
+        finally:
+            server.stop()
+
+    def test_server_runs_on_uvloop_when_available(self, tmp_path, monkeypatch):
+        """Test that the server runs its loop from uvloop's factory when the module is present."""
+        import asyncio
+        import types
+        import kvstore.network.server as server_module
+
+        created = []
+
+        def new_event_loop():
+            loop = asyncio.new_event_loop()
+            created.append(loop)
+            return loop
+
+        monkeypatch.setattr(server_module, "uvloop", types.SimpleNamespace(new_event_loop=new_event_loop))
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+
+        try:
+            time.sleep(0.5)
+            with KVClient(host="localhost", port=server.server_socket.getsockname()[1]) as client:
+                assert client.put("key", "value")
+                assert client.read("key") == "value"
+            assert len(created) == 1
+        finally:
+            server.stop()
+        assert created[0].is_closed()
+
+    def test_server_reassembles_fragmented_messages(self, tmp_path):
+        """Test that messages split across recvs, or sharing one, are each handled once."""
+        server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
+
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        time.sleep(0.1)
+
+        actual_port = server.server_socket.getsockname()[1]
+
+        try:
+            with socket.create_connection(("localhost", actual_port)) as sock:
+                value = b"v" * 20000
+                for fragment in (b"PUT big " + value[:7000], value[7000:], b"\nPUT k", b"2 x\nREAD k2\n"):
+                    sock.sendall(fragment)
+                    time.sleep(0.05)
+
+                received = b""
+                while received.count(b"\n") < 3:
+                    received += sock.recv(4096)
+                assert received == b"OK\nOK\nx\n"
+
+            with KVClient(host="localhost", port=actual_port) as client:
+                assert client.read("big") == value.decode()
+
+        finally:
+            server.stop()
+
     def test_server_data_persists_between_clients(self, tmp_path):
         """Test that data persists between different client connections."""
         server = KVServer(host="localhost", port=0, data_dir=str(tmp_path))
@@ -177,6 +177,24 @@ class TestReplicaManager:
         assert len(healthy) == 1
         assert healthy[0] == replica2
 
+    def test_healthy_replicas_cached_until_health_changes(self):
+        """Test the healthy set is reused between calls and refreshed on changes."""
+        manager = ReplicaManager(max_failures=1)
+
+        replica1 = manager.add_replica('localhost', 5556)
+        replica2 = manager.add_replica('localhost', 5557)
+
+        healthy = manager.get_healthy_replicas()
+        assert manager.get_healthy_replicas() is healthy
+        assert set(healthy) == {replica1, replica2}
+
+        manager.mark_failure(replica1)
+        assert manager.get_healthy_replicas() == (replica2,)
+
+        manager.mark_success(replica1)
+        manager.remove_replica('localhost', 5557)
+        assert manager.get_healthy_replicas() == (replica1,)
+
     def test_mark_success(self):
         """Test marking replica success."""
         manager = ReplicaManager()
@@ -205,6 +223,31 @@ class TestReplicaManager:
         assert replica.is_healthy is False
         assert replica.last_failure is not None
 
+    def test_health_check_restores_reachable_replica(self):
+        """Test the health check marks a reachable replica healthy and stops promptly."""
+        import socket
+
+        listener = socket.socket()
+        listener.bind(('localhost', 0))
+        listener.listen()
+        try:
+            manager = ReplicaManager(health_check_interval=0.05)
+            replica = manager.add_replica('localhost', listener.getsockname()[1])
+            replica.is_healthy = False
+
+            manager.start_health_monitoring()
+            deadline = time.time() + 2.0
+            while not replica.is_healthy and time.time() < deadline:
+                time.sleep(0.05)
+            assert replica.is_healthy is True
+
+            manager.health_check_interval = 60
+            start = time.time()
+            manager.stop_health_monitoring()
+            assert time.time() - start < 1.0
+        finally:
+            listener.close()
+
     def test_get_status(self):
         """Test getting replica status."""
         manager = ReplicaManager()
@@ -256,6 +299,60 @@ class TestReplicator:
 
         replicator.stop()
 
+    def test_queued_writes_to_same_key_coalesce(self):
+        """Test a queued put absorbs newer puts for its key, but not across a delete or batch."""
+        manager = ReplicaManager()
+        replicator = Replicator(manager, mode='async')
+
+        replicator.replicate_put(b'key1', b'v1')
+        replicator.replicate_put(b'key1', b'v2')
+        replicator.replicate_put(b'key1', b'v3')
+        assert replicator.queue.qsize() == 1
+
+        replicator.replicate_delete(b'key1')
+        replicator.replicate_put(b'key1', b'v4')
+        replicator.replicate_batch_put([b'key1'], [b'v5'])
+        replicator.replicate_put(b'key1', b'v6')
+
+        ops = [replicator.queue.get_nowait() for _ in range(replicator.queue.qsize())]
+        assert [(op.op, op.value) for op in ops] == [
+            ('put', b'v3'), ('delete', None), ('put', b'v4'), ('batch_put', None), ('put', b'v6')]
+        assert replicator.get_stats()['coalesced_operations'] == 2
+
+    def test_consecutive_puts_sent_as_one_batch(self):
+        """Test runs of puts are merged into one REPLICATE BATCHPUT command."""
+        from kvstore.replication.replicator import ReplicationOperation
+
+        ops = [ReplicationOperation('put', key=b'a', value=b'1\n'),
+               ReplicationOperation('put', key=b'b', value=b'2'),
+               ReplicationOperation('delete', key=b'a'),
+               ReplicationOperation('put', key=b'c', value=b'3'),
+               ReplicationOperation('put', key=b'd', value=b'x||y'),
+               ReplicationOperation('put', key=b'e', value=b'5')]
+
+        commands, sizes = Replicator._build_commands(ops)
+
+        assert commands == [b'REPLICATE BATCHPUT a||b 1\\n||2', b'REPLICATE DELETE a',
+                            b'REPLICATE PUT c 3', b'REPLICATE PUT d x||y', b'REPLICATE PUT e 5']
+        assert sizes == [2, 1, 1, 1, 1]
+
+    def test_repeated_failure_logged_once(self, caplog):
+        """Test identical replication warnings within the repeat window are logged once."""
+        from kvstore.replication.replicator import logger
+
+        for log_filter in logger.filters:
+            log_filter._last_seen.clear()  # Forget messages logged by earlier tests
+        manager = ReplicaManager()
+        replicator = Replicator(manager, mode='async', queue_size=1)
+
+        with caplog.at_level('WARNING', logger='kvstore.replication.replicator'):
+            replicator.replicate_put(b'key1', b'value1')
+            for _ in range(5):
+                assert replicator.replicate_delete(b'key2') is False
+
+        assert sum('Queue full' in r.getMessage() for r in caplog.records) == 1
+        assert replicator.get_stats()['dropped_operations'] == 5
+
     def test_get_stats(self):
         """Test getting replication stats."""
         manager = ReplicaManager()
@@ -397,6 +494,26 @@ class TestEndToEndReplication:
                 assert value == expected_value, \
                     f"Replica on port {port} mismatch for {key}"
 
+    def test_replication_reuses_connections(self, master_server, replica_servers, replica_ports):
+        """Test replication keeps its connections open and carries special characters intact."""
+        master_client = KVClient(host='localhost', port=15555)
+
+        values = {f'multi{i}': f'line\n{i}\\end' for i in range(20)}
+        for key, value in values.items():
+            assert master_client.put(key, value)
+        assert master_client.batch_put(['b1', 'b2'], ['tab\there', 'cr\rhere'])
+        values.update({'b1': 'tab\there', 'b2': 'cr\rhere'})
+
+        for port, server in zip(replica_ports[:2], replica_servers):
+            replica_client = KVClient(host='localhost', port=port)
+            for key, value in values.items():
+                assert wait_for_replication(replica_client, key, value), \
+                    f"Replica on port {port} mismatch for {key}"
+            replica_client.close()
+            time.sleep(0.1)
+            # Replication connections stay open: at most one per worker, not one per operation
+            assert 1 <= len(server._handlers) <= master_server.store.replicator.num_workers
+
     def test_replica_read_only(self, replica_servers, replica_ports):
         """Test that replicas reject direct write commands from clients."""
         # Connect to replica